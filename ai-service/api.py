@@ -1,79 +1,65 @@
 import os
 import json
 import logging
-import io
+import uuid
 import asyncio
-from datetime import date
-from typing import List
+from typing import List, Optional, Literal
 from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, delete
 
 import redis.asyncio as redis_async
 import redis as redis_sync
-from openai import OpenAI
-from pypdf import PdfReader
-import markdown
-from xhtml2pdf import pisa
-from io import BytesIO
-
-from celery_config import celery_app
-from database import SessionLocal, JobEntry, UserProfile, SettingsData, CVDataModel
+
+from celery_config import celery_app, REDIS_URL
+from database import JobEntry, UserProfile, SettingsData, CVDataModel, POOL_METRICS_KEY
+from database_async import AsyncSessionLocal, async_engine, async_pool_stats
+import seen_urls
+import page_cache
+import llm_cache
+import llm_gateway
+import relevance
+import job_listing
+import job_sink
+import profile_cache
+import cv_ingest
+import events
+import crawl_runs
+from ws_manager import WebSocketManager
+import pdf_renderer
+import url_classifier
 # Note: tasks are referenced by name strings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENAI_API_KEY"),
-)
+redis_client = redis_async.from_url(REDIS_URL, decode_responses=True)
+# Für Binärdaten (gerenderte PDFs)
+redis_binary = redis_async.from_url(REDIS_URL)
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-    async def broadcast(self, message: str):
-        for connection in self.active_connections[:]:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                self.disconnect(connection)
+manager = WebSocketManager()
 
-manager = ConnectionManager()
+def notify_resync():
+    # Events gingen verloren (Stream getrimmt): Clients holen sich den Stand über /jobs/changes
+    manager.broadcast(json.dumps({"v": events.EVENT_SCHEMA_VERSION, "type": "resync"}))
 
-async def redis_listener():
-    redis_url = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
-    logger.info(f" cercando Redis at {redis_url}...")
-    
-    try:
-        r = redis_async.from_url(redis_url, encoding="utf-8", decode_responses=True)
-        pubsub = r.pubsub()
-        await pubsub.subscribe("job_updates")
-        logger.info("✅ Erflogreich auf Kanal 'job_updates' abonniert!")
-
-        async for message in pubsub.listen():
-            logger.debug(f"🔍 Rohe Nachricht von Redis: {message}")
-            if message["type"] == "message":
-                payload = message["data"]
-                logger.debug(f"Event empfangen & wird gebroadcastet: {payload}")
-                await manager.broadcast(payload)
-    except Exception as e:
-        logger.error(f"RITISCHER FEHLER im Redis Listener: {e}")
+# Jede API-Replika liest den gemeinsamen Event-Stream selbst und bedient ihre eigenen Sockets
+event_listener = events.StreamListener(REDIS_URL, on_event=manager.dispatch, on_gap=notify_resync)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    logger.info("🚀 Starte Redis Listener Task...")
-    task = asyncio.create_task(redis_listener())
+    logger.info("🚀 Starte Event-Stream Listener...")
+    task = asyncio.create_task(event_listener.run())
+    # xhtml2pdf ist CPU-lastig: eigene Prozesse statt Threads, damit der GIL die API nicht bremst
+    app.state.pdf_pool = ProcessPoolExecutor(max_workers=pdf_renderer.PDF_RENDER_PROCESSES)
     yield
     task.cancel()
+    app.state.pdf_pool.shutdown(wait=False, cancel_futures=True)
+    await async_engine.dispose()
     
 app = FastAPI(lifespan=lifespan)
 
@@ -84,83 +70,116 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
     allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["ETag"]
 )
 
-def extract_text_from_pdf(file_bytes):
-    try:
-        reader = PdfReader(io.BytesIO(file_bytes))
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        logger.error(f"PDF Read Error: {e}")
-        return ""
-
-def parse_cv_with_ai(cv_text):
-    system_prompt = """
-    Du bist ein Daten-Extraktions-Assistent. 
-    Deine Aufgabe: Extrahiere strukturierte Daten aus einem Lebenslauf-Text.
-    
-    Antworte AUSSCHLIESSLICH mit validem JSON. Keine Markdown-Formatierung (kein ```json).
-    
-    Das Ziel-Format ist:
-    {
-      "role": "Aktuelle oder angestrebte Rolle (z.B. Senior Python Dev)",
-      "skills": "Liste von Skills, kommagetrennt (z.B. Python, Docker, AWS)",
-      "min_salary": "Geschätztes Wunschgehalt als Zahl-String (z.B. 70000), falls im Text, sonst leer lassen",
-      "location": "Wohnort oder Wunschort, falls im Text, sonst 'Remote'",
-      "cv_data": {
-        "education": "Zusammenfassung der Ausbildung",
-        "experience": [
-          { "company": "Firmenname", "role": "Titel", "duration": "Zeitraum", "description": "Kurze Beschreibung" }
-        ],
-        "projects": [
-           { "name": "Projektname", "tech_stack": "Genutzte Technologien", "description": "Beschreibung" }
-        ]
-      }
-    }
-    """
-
-    user_prompt = f"Hier ist der Lebenslauf:\n\n{cv_text}"
-
-    try:
-        response = client.chat.completions.create(
-            model="tngtech/deepseek-r1t2-chimera:free",
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
-            temperature=0.0
-        )
-        content = response.choices[0].message.content.strip()
-        content = content.replace("```json", "").replace("```", "")
-        return json.loads(content)
-    except Exception as e:
-        logger.error(f"AI Parse Error: {e}")
-        return None
-
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    client = await manager.connect(websocket)
     try:
         while True:
-            await websocket.receive_text()
+            # Client-Nachrichten: {"action": "subscribe" | "unsubscribe", "job_id": "..."}
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                continue
+            if not isinstance(message, dict) or not message.get("job_id"):
+                continue
+            if message.get("action") == "subscribe":
+                manager.subscribe(client, str(message["job_id"]))
+            elif message.get("action") == "unsubscribe":
+                manager.unsubscribe(client, str(message["job_id"]))
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
+    finally:
+        manager.disconnect(client)
 
 @app.get("/status")
 async def get_system_status():
-    redis_url = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
-    r = redis_sync.from_url(redis_url, decode_responses=True)
-    is_crawling = r.get("system:crawling")
+    is_crawling = await redis_client.get(crawl_runs.CRAWLING_KEY)
     return {"crawling": bool(is_crawling)}
 
+@app.get("/crawls/{run_id}")
+async def get_crawl_run(run_id: str):
+    run = crawl_runs.summarize(await redis_client.hgetall(crawl_runs.run_key(run_id)))
+    if not run:
+        raise HTTPException(status_code=404, detail="Crawl run not found")
+    return run
+
+@app.get("/metrics/llm-cache")
+def get_llm_cache_metrics():
+    return llm_cache.get_stats()
+
+@app.get("/metrics/llm")
+async def get_llm_metrics():
+    return await llm_gateway.get_metrics()
+
+@app.get("/metrics/ws")
+async def get_ws_metrics():
+    return {**manager.metrics(), "event_stream": event_listener.metrics()}
+
+@app.get("/metrics/db-pool")
+async def get_db_pool_metrics():
+    workers = {field: json.loads(value) for field, value in (await redis_client.hgetall(POOL_METRICS_KEY)).items()}
+    return {"api": async_pool_stats(), "workers": workers}
+
+@app.get("/metrics/filter-urls")
+def get_filter_urls_metrics():
+    r = redis_sync.from_url(REDIS_URL, decode_responses=True)
+    return {k: int(v) for k, v in r.hgetall(url_classifier.STATS_KEY).items()}
+
+@app.get("/analysis/calibration")
+async def get_score_calibration():
+    async with AsyncSessionLocal() as db:
+        pairs = (await db.execute(select(JobEntry.local_score, JobEntry.match_score).where(
+            JobEntry.local_score.isnot(None),
+            JobEntry.match_score.isnot(None),
+            JobEntry.score_source == "llm"
+        ))).all()
+    return relevance.calibration_report(pairs)
+
 @app.get("/jobs")
-def get_jobs():
-    db = SessionLocal()
-    try:
-        return db.query(JobEntry).order_by(JobEntry.match_score.desc()).all()
-    finally:
-        db.close()
+async def get_jobs(
+    request: Request,
+    response: Response,
+    sort: Literal["score", "date"] = "score",
+    cursor: Optional[str] = None,
+    limit: int = Query(job_listing.DEFAULT_PAGE_SIZE, ge=1, le=job_listing.MAX_PAGE_SIZE),
+    status: Optional[List[str]] = Query(None),
+):
+    async with AsyncSessionLocal() as db:
+        try:
+            etag = await job_listing.list_etag(db, redis_client, sort=sort, cursor=cursor, limit=limit, status=status)
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+
+            # Cursor vor dem Lesen der Seite, damit der Change-Feed nichts dazwischen verliert
+            changes_cursor = await job_listing.changes_cursor(db, redis_client)
+            items, next_cursor = await job_listing.list_jobs(db, sort=sort, cursor=cursor, limit=limit, statuses=status)
+        except job_listing.InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    response.headers["ETag"] = etag
+    return {"items": items, "next_cursor": next_cursor, "changes_cursor": changes_cursor}
+
+@app.get("/jobs/changes")
+async def get_job_changes(
+    since: str,
+    limit: int = Query(job_listing.MAX_PAGE_SIZE, ge=1, le=job_listing.MAX_PAGE_SIZE),
+):
+    async with AsyncSessionLocal() as db:
+        try:
+            return await job_listing.list_changes(db, redis_client, since, limit=limit)
+        except job_listing.InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    async with AsyncSessionLocal() as db:
+        job = await db.get(JobEntry, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job nicht gefunden")
+    return job
 
 @app.post("/jobs/{job_id}/generate")
 def trigger_generation(job_id: str):
@@ -171,24 +190,21 @@ def trigger_generation(job_id: str):
     return {"status": "started"}
 
 @app.get("/settings")
-def get_settings():
-    db = SessionLocal()
-    try:
-        profile = db.query(UserProfile).filter(UserProfile.id == 1).first()
+async def get_settings():
+    async with AsyncSessionLocal() as db:
+        profile = await db.get(UserProfile, 1)
         if not profile:
             profile = UserProfile(id=1, cv_data={"experience": [], "projects": [], "education": ""}, job_urls=[])
             db.add(profile)
-            db.commit()
-            db.refresh(profile)
+            await db.commit()
+            await db.refresh(profile)
+            await profile_cache.publish_async(redis_client, profile)
         return profile
-    finally:
-        db.close()
 
 @app.post("/settings")
-def save_settings(settings: SettingsData):
-    db = SessionLocal()
-    try:
-        profile = db.query(UserProfile).filter(UserProfile.id == 1).first()
+async def save_settings(settings: SettingsData):
+    async with AsyncSessionLocal() as db:
+        profile = await db.get(UserProfile, 1)
         if not profile:
             profile = UserProfile(id=1)
             db.add(profile)
@@ -200,179 +216,106 @@ def save_settings(settings: SettingsData):
         profile.preferences = settings.preferences
         profile.cv_data = settings.cv_data.dict()
         profile.job_urls = settings.job_urls
+        profile.version = (profile.version or 0) + 1
         
-        db.commit()
+        await db.commit()
+        await profile_cache.publish_async(redis_client, profile)
         return {"status": "saved"}
-    finally:
-        db.close()
 
 @app.delete("/settings")
-def delete_settings():
-    db = SessionLocal()
-    try:
-        profile = db.query(UserProfile).filter(UserProfile.id == 1).first()
-        if profile:
-            db.delete(profile)
-            db.commit()
-            return {"status": "deleted"}
-        else:
+async def delete_settings():
+    async with AsyncSessionLocal() as db:
+        profile = await db.get(UserProfile, 1)
+        if not profile:
             raise HTTPException(status_code=404, detail="Profil nicht gefunden")
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Fehler beim Löschen der Einstellungen: {e}")
-        raise HTTPException(status_code=500, detail="Datenbankfehler")
-    finally:
-        db.close()
+        try:
+            await db.delete(profile)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Fehler beim Löschen der Einstellungen: {e}")
+            raise HTTPException(status_code=500, detail="Datenbankfehler")
+    await profile_cache.publish_async(redis_client, None)
+    return {"status": "deleted"}
 
 @app.get("/jobs/{job_id}/download")
-def download_application_pdf(job_id: str):
-    db = SessionLocal()
-    try:
-        job = db.query(JobEntry).filter(JobEntry.id == job_id).first()
-        profile = db.query(UserProfile).filter(UserProfile.id == 1).first()
-        
-        if not job or not job.application_draft:
-            raise HTTPException(status_code=404, detail="Kein Anschreiben gefunden")
+async def download_application_pdf(job_id: str):
+    async with AsyncSessionLocal() as db:
+        job = await db.get(JobEntry, job_id)
+        profile = await db.get(UserProfile, 1)
 
-        html_content = markdown.markdown(job.application_draft)
+    if not job or not job.application_draft:
+        raise HTTPException(status_code=404, detail="Kein Anschreiben gefunden")
 
-        today_str = date.today().strftime("%d.%m.%Y")
-        applicant_name = "Dein Name"
-        
-        full_html = f"""
-        <html>
-        <head>
-            <style>
-                @page {{
-                    size: A4;
-                    margin: 2.5cm 2cm 2cm 2.5cm; /* Standard Rand */
-                }}
-                body {{
-                    font-family: Helvetica, Arial, sans-serif;
-                    font-size: 11pt;
-                    line-height: 1.5;
-                    color: #000;
-                }}
-                .header {{
-                    margin-bottom: 2cm;
-                    font-size: 9pt;
-                    color: #555;
-                    border-bottom: 1px solid #ccc;
-                    padding-bottom: 10px;
-                }}
-                .sender {{
-                    font-size: 8pt;
-                    text-decoration: underline;
-                    margin-bottom: 1cm;
-                }}
-                .meta {{
-                    text-align: right;
-                    margin-bottom: 1cm;
-                }}
-                .address {{
-                    margin-bottom: 2cm;
-                    font-size: 11pt;
-                }}
-                .subject {{
-                    font-weight: bold;
-                    margin-bottom: 1cm;
-                    font-size: 12pt;
-                }}
-                .content {{
-                    text-align: justify;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="sender">{applicant_name} • Musterstraße 1 • 12345 Musterstadt</div>
-
-            <div class="meta">
-                {profile.location if profile else "Musterstadt"}, den {today_str}
-            </div>
-
-            <div class="address">
-                {job.company}<br>
-                Personalabteilung<br>
-                (Adresse unbekannt)
-            </div>
-
-            <div class="content">
-                {html_content}
-            </div>
-        </body>
-        </html>
-        """
-
-        pdf_buffer = BytesIO()
-        pisa_status = pisa.CreatePDF(src=full_html, dest=pdf_buffer)
-
-        if pisa_status.err:
-            raise HTTPException(status_code=500, detail="PDF Fehler")
-
-        pdf_buffer.seek(0)
-        
-        filename = f"Bewerbung_{job.title.replace(' ', '_')}.pdf"
-        return StreamingResponse(
-            pdf_buffer, 
-            media_type="application/pdf", 
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+    location = profile.location if profile else None
+    today = pdf_renderer.today_str()
+    key = pdf_renderer.cache_key(job.application_draft, job.company, location, today)
+    filename = f"Bewerbung_{job.title.replace(' ', '_')}.pdf"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+
+    pdf_bytes = await pdf_renderer.get_cached(redis_binary, key)
+    if pdf_bytes:
+        headers["X-PDF-Cache"] = "hit"
+        return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
+    try:
+        loop = asyncio.get_running_loop()
+        pdf_bytes = await loop.run_in_executor(
+            app.state.pdf_pool, pdf_renderer.render_pdf, job.application_draft, job.company, location, today
         )
+    except RuntimeError as e:
+        logger.error(f"PDF Fehler für Job {job_id}: {e}")
+        raise HTTPException(status_code=500, detail="PDF Fehler")
 
-    finally:
-        db.close()
+    await pdf_renderer.store(redis_binary, key, pdf_bytes)
+    headers["X-PDF-Cache"] = "miss"
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
 
-@app.post("/settings/upload-cv")
+@app.post("/settings/upload-cv", status_code=202)
 async def upload_cv(file: UploadFile = File(...)):
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Nur PDF Dateien erlaubt.")
 
     content = await file.read()
-    text = extract_text_from_pdf(content)
-    
-    if len(text) < 50:
-        raise HTTPException(status_code=400, detail="Konnte keinen Text aus dem PDF lesen (evtl. Bild-Scan?).")
-
-    parsed_data = parse_cv_with_ai(text)
-    
-    if not parsed_data:
-         raise HTTPException(status_code=500, detail="AI konnte CV nicht verarbeiten.")
-
-    db = SessionLocal()
-    try:
-        profile = db.query(UserProfile).filter(UserProfile.id == 1).first()
-        if not profile:
-            profile = UserProfile(id=1)
-            db.add(profile)
-        
-        profile.role = parsed_data.get("role", profile.role)
-        profile.skills = parsed_data.get("skills", profile.skills)
-        if parsed_data.get("min_salary"): profile.min_salary = parsed_data.get("min_salary")
-        if parsed_data.get("location"): profile.location = parsed_data.get("location")
-        
-        profile.cv_data = parsed_data.get("cv_data", {})
-        
-        db.commit()
-        return {"status": "success", "data": parsed_data}
-    
-    except Exception as e:
-        logger.error(f"DB Save Error: {e}")
-        raise HTTPException(status_code=500, detail="Datenbank Fehler")
-    finally:
-        db.close()
+    if not content:
+        raise HTTPException(status_code=400, detail="Leere Datei.")
+
+    # Extraktion und LLM-Parsing laufen im Worker, Fortschritt kommt als cv_progress über /ws
+    ingest_id = uuid.uuid4().hex
+    content_hash = cv_ingest.file_hash(content)
+    await redis_binary.set(cv_ingest.upload_key(ingest_id), content, ex=cv_ingest.UPLOAD_TTL)
+    await run_in_threadpool(
+        celery_app.send_task, "ai.ingest_cv", args=[ingest_id, content_hash], queue="ai_queue"
+    )
+    return {"status": "queued", "ingest_id": ingest_id}
+
+@app.get("/settings/upload-cv/{ingest_id}")
+async def get_cv_ingest_status(ingest_id: str):
+    raw = await redis_client.hgetall(cv_ingest.status_key(ingest_id))
+    if not raw:
+        # Noch nicht vom Worker übernommen (oder unbekannt/abgelaufen)
+        if await redis_binary.exists(cv_ingest.upload_key(ingest_id)):
+            return {"ingest_id": ingest_id, "stage": "queued", "progress": 0}
+        raise HTTPException(status_code=404, detail="Unbekannter Upload")
+    return cv_ingest.decode_status(raw)
 
 @app.get("/reset")
-def reset_db():
-    from sqlalchemy import text
-    db = SessionLocal()
-    try:
-        # Löscht Jobs UND User Settings
-        db.query(JobEntry).delete()
-        db.query(UserProfile).delete()
-        db.commit()
-        return {"status": "cleared (jobs & settings)"}
-    except Exception as e:
-        logger.error(f"Reset Error: {e}")
-        db.rollback()
-        return {"status": "error"}
-    finally:
-        db.close()
+async def reset_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            # Löscht Jobs UND User Settings
+            await db.execute(delete(JobEntry))
+            await db.execute(delete(UserProfile))
+            await db.commit()
+        except Exception as e:
+            logger.error(f"Reset Error: {e}")
+            await db.rollback()
+            return {"status": "error"}
+
+    await seen_urls.clear(redis_client)
+    await job_sink.clear_announced(redis_client)
+    cleared = await page_cache.clear_async(redis_client)
+    logger.info(f"Reset: {cleared} page cache entries removed.")
+    await profile_cache.publish_async(redis_client, None)
+    await job_listing.bump_generation(redis_client)
+    return {"status": "cleared (jobs & settings)"}
@@ -0,0 +1,120 @@
+import os
+import json
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Der Planungs-Lock überlebt den Countdown nur um diese Sekunden: geht der Flush-Task verloren,
+# plant der nächste push (oder recover_batches per Beat) neu, statt den ganzen Claim-Timeout zu warten
+SCHEDULE_LOCK_GRACE = float(os.getenv("BATCH_SCHEDULE_LOCK_GRACE", "30"))
+
+# Verschiebt bis zu N Einträge atomar von "pending" in eine eigene Processing-Liste
+_CLAIM_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items == 0 then return items end
+redis.call('LTRIM', KEYS[1], #items, -1)
+redis.call('RPUSH', KEYS[2], unpack(items))
+redis.call('ZADD', KEYS[3], ARGV[2], ARGV[3])
+return items
+"""
+
+# Legt die Einträge eines abgebrochenen Batches zurück an den Anfang der Queue
+_REQUEUE_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[2], 0, -1)
+for i = #items, 1, -1 do redis.call('LPUSH', KEYS[1], items[i]) end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[3], ARGV[1])
+return #items
+"""
+
+
+class RedisBatchQueue:
+    """Durable micro-batching buffer in Redis.
+
+    Producers ``push`` items; a flush task named ``flush_task`` is scheduled
+    once per window (or immediately when ``max_items`` are waiting) and
+    processes them via ``claim``/``ack``. Claimed batches live in their own
+    list until acknowledged, so a crashed worker's batch is re-queued by
+    ``recover_stale`` instead of being lost; ``recover`` runs that
+    periodically and reschedules a flush for items left waiting.
+    """
+
+    def __init__(self, r, name, celery_app, flush_task, max_items, window_seconds, queue="ai_queue", processing_timeout=300):
+        self.r = r
+        self.name = name
+        self.celery_app = celery_app
+        self.flush_task = flush_task
+        self.max_items = max_items
+        self.window_seconds = window_seconds
+        self.queue = queue
+        self.processing_timeout = processing_timeout
+        self.pending_key = f"{name}:pending"
+        self.scheduled_key = f"{name}:scheduled"
+        self.batches_key = f"{name}:batches"
+        self._claim = r.register_script(_CLAIM_SCRIPT)
+        self._requeue = r.register_script(_REQUEUE_SCRIPT)
+
+    def _processing_key(self, batch_id):
+        return f"{self.name}:processing:{batch_id}"
+
+    def _schedule(self, countdown):
+        lock_ms = int((countdown + SCHEDULE_LOCK_GRACE) * 1000)
+        if self.r.set(self.scheduled_key, "1", nx=True, px=lock_ms):
+            self.celery_app.send_task(self.flush_task, queue=self.queue, countdown=countdown)
+
+    def push(self, item):
+        size = self.r.rpush(self.pending_key, json.dumps(item))
+        if size >= self.max_items:
+            # Voller Batch: nicht auf das Zeitfenster warten
+            self.celery_app.send_task(self.flush_task, queue=self.queue)
+        else:
+            self._schedule(self.window_seconds)
+        return size
+
+    def claim(self):
+        batch_id = uuid.uuid4().hex
+        items = self._claim(
+            keys=[self.pending_key, self._processing_key(batch_id), self.batches_key],
+            args=[self.max_items, time.time(), batch_id],
+        )
+        return batch_id, [json.loads(item) for item in items]
+
+    def ack(self, batch_id):
+        pipe = self.r.pipeline()
+        pipe.delete(self._processing_key(batch_id))
+        pipe.zrem(self.batches_key, batch_id)
+        pipe.execute()
+
+    def touch(self, batch_id):
+        """Extend the claim of a batch that is still being processed (heartbeat for long flushes)."""
+        # xx: ein bereits von recover_stale übernommener Batch wird nicht wieder eingetragen
+        self.r.zadd(self.batches_key, {batch_id: time.time()}, xx=True)
+
+    def requeue(self, batch_id):
+        return self._requeue(keys=[self.pending_key, self._processing_key(batch_id), self.batches_key], args=[batch_id])
+
+    def recover_stale(self):
+        stale = self.r.zrangebyscore(self.batches_key, 0, time.time() - self.processing_timeout)
+        for batch_id in stale:
+            if isinstance(batch_id, bytes):
+                batch_id = batch_id.decode()
+            count = self.requeue(batch_id)
+            logger.warning(f"Re-queued {count} items of stale batch {batch_id} ({self.name}).")
+        return len(stale)
+
+    def recover(self):
+        """Re-queue stale claims and make sure waiting items get a flush (periodic, via beat)."""
+        recovered = self.recover_stale()
+        if self.r.llen(self.pending_key):
+            self._schedule(0)
+        return recovered
+
+    def finish_flush(self):
+        # Lock freigeben; liegt schon wieder etwas an, sofort den nächsten Flush planen
+        self.r.delete(self.scheduled_key)
+        remaining = self.r.llen(self.pending_key)
+        if remaining:
+            self._schedule(0 if remaining >= self.max_items else self.window_seconds)
+        return remaining
@@ -0,0 +1,159 @@
+import io
+import json
+import hashlib
+import logging
+import time
+
+from pypdf import PdfReader
+
+from database import UserProfile
+from llm_cache import cached_completion, parse_json_response
+import events
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_TTL = 15 * 60
+STATUS_TTL = 24 * 3600
+# Parse-Ergebnisse pro Datei-Hash: derselbe Lebenslauf kostet beim zweiten Upload nichts
+PARSED_TTL = 90 * 24 * 3600
+MIN_TEXT_LENGTH = 50
+
+
+def file_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def upload_key(ingest_id):
+    return f"cv:upload:{ingest_id}"
+
+
+def status_key(ingest_id):
+    return f"cv:ingest:{ingest_id}"
+
+
+def parsed_key(content_hash):
+    return f"cv:parsed:{content_hash}"
+
+
+class IngestFailed(Exception):
+    pass
+
+
+class Progress:
+    """Store the ingestion state in Redis and announce its stage as a cv_progress event."""
+
+    def __init__(self, r, ingest_id):
+        self.r = r
+        self.ingest_id = ingest_id
+
+    def __call__(self, stage, progress, **fields):
+        state = {"ingest_id": self.ingest_id, "stage": stage, "progress": progress, "ts": time.time(), **fields}
+        pipe = self.r.pipeline()
+        pipe.hset(status_key(self.ingest_id), mapping={k: json.dumps(v) for k, v in state.items()})
+        pipe.expire(status_key(self.ingest_id), STATUS_TTL)
+        # Event geht an alle Sockets: nur Fortschritt, Ergebnis und Fehler holt der Client über den Status-Endpunkt
+        events.publish(pipe, {"type": "cv_progress", "ingest_id": self.ingest_id, "stage": stage, "progress": progress})
+        pipe.execute()
+
+
+def decode_status(raw):
+    return {k: json.loads(v) for k, v in raw.items()}
+
+
+def get_cached_parse(r, content_hash):
+    raw = r.get(parsed_key(content_hash))
+    return json.loads(raw) if raw else None
+
+
+def cache_parse(r, content_hash, parsed):
+    r.set(parsed_key(content_hash), json.dumps(parsed, ensure_ascii=False), ex=PARSED_TTL)
+
+
+def extract_text_from_pdf(file_bytes):
+    try:
+        reader = PdfReader(io.BytesIO(file_bytes))
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    except Exception as e:
+        logger.error(f"PDF Read Error: {e}")
+        return ""
+
+
+def parse_cv_with_ai(cv_text):
+    system_prompt = """
+    Du bist ein Daten-Extraktions-Assistent. 
+    Deine Aufgabe: Extrahiere strukturierte Daten aus einem Lebenslauf-Text.
+    
+    Antworte AUSSCHLIESSLICH mit validem JSON. Keine Markdown-Formatierung (kein ```json).
+    
+    Das Ziel-Format ist:
+    {
+      "role": "Aktuelle oder angestrebte Rolle (z.B. Senior Python Dev)",
+      "skills": "Liste von Skills, kommagetrennt (z.B. Python, Docker, AWS)",
+      "min_salary": "Geschätztes Wunschgehalt als Zahl-String (z.B. 70000), falls im Text, sonst leer lassen",
+      "location": "Wohnort oder Wunschort, falls im Text, sonst 'Remote'",
+      "cv_data": {
+        "education": "Zusammenfassung der Ausbildung",
+        "experience": [
+          { "company": "Firmenname", "role": "Titel", "duration": "Zeitraum", "description": "Kurze Beschreibung" }
+        ],
+        "projects": [
+           { "name": "Projektname", "tech_stack": "Genutzte Technologien", "description": "Beschreibung" }
+        ]
+      }
+    }
+    """
+
+    user_prompt = f"Hier ist der Lebenslauf:\n\n{cv_text}"
+
+    try:
+        return cached_completion(
+            "parse_cv",
+            model="tngtech/deepseek-r1t2-chimera:free",
+            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+            parse=parse_json_response,
+            temperature=0.0
+        )
+    except Exception as e:
+        logger.error(f"AI Parse Error: {e}")
+        return None
+
+
+def parse_upload(r, ingest_id, content_hash, progress):
+    """Extract and parse an uploaded CV, reusing an earlier result for the same file."""
+    parsed = get_cached_parse(r, content_hash)
+    if parsed:
+        progress("cached", 60)
+        return parsed
+
+    content = r.get(upload_key(ingest_id))
+    if not content:
+        raise IngestFailed("Upload abgelaufen, bitte erneut hochladen.")
+
+    progress("extracting", 20)
+    text = extract_text_from_pdf(content)
+    if len(text) < MIN_TEXT_LENGTH:
+        raise IngestFailed("Konnte keinen Text aus dem PDF lesen (evtl. Bild-Scan?).")
+
+    progress("parsing", 40)
+    parsed = parse_cv_with_ai(text)
+    if not parsed:
+        raise IngestFailed("AI konnte CV nicht verarbeiten.")
+    cache_parse(r, content_hash, parsed)
+    return parsed
+
+
+def apply_to_profile(db, parsed_data):
+    profile = db.query(UserProfile).filter(UserProfile.id == 1).first()
+    if not profile:
+        profile = UserProfile(id=1)
+        db.add(profile)
+
+    profile.role = parsed_data.get("role", profile.role)
+    profile.skills = parsed_data.get("skills", profile.skills)
+    if parsed_data.get("min_salary"): profile.min_salary = parsed_data.get("min_salary")
+    if parsed_data.get("location"): profile.location = parsed_data.get("location")
+
+    profile.cv_data = parsed_data.get("cv_data", {})
+    profile.version = (profile.version or 0) + 1
+    db.commit()
+    return profile
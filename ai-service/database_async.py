@@ -0,0 +1,30 @@
+import os
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database import DATABASE_URL, DB_POOL_MODE, engine_options, track_pool, pool_stats
+
+# Gleiche Datenbank und Modelle wie database.py, aber asyncpg für die FastAPI-Endpunkte.
+# Der Celery-Worker bleibt beim synchronen Engine.
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    DATABASE_URL.replace("postgresql+psycopg2://", "postgresql://", 1).replace("postgresql://", "postgresql+asyncpg://", 1),
+)
+
+
+def async_engine_options(mode=DB_POOL_MODE):
+    options = engine_options(mode)
+    if mode == "pgbouncer":
+        # PgBouncer im Transaction-Mode kennt keine Prepared Statements über Transaktionen hinweg
+        options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    return options
+
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **async_engine_options())
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+track_pool(async_engine.sync_engine)
+
+
+def async_pool_stats():
+    return pool_stats(async_engine.sync_engine)
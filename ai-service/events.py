@@ -0,0 +1,114 @@
+import os
+import json
+import random
+import asyncio
+import logging
+
+import redis.asyncio as redis_async
+
+logger = logging.getLogger(__name__)
+
+# Gemeinsam mit scraper-service/events.py: Echtzeit-Events laufen über einen Redis Stream statt Pub/Sub,
+# damit die API-Replikas nach einem Reconnect ab ihrem letzten Offset weiterlesen können
+EVENTS_STREAM = "events:job_updates"
+EVENTS_MAXLEN = int(os.getenv("EVENTS_MAXLEN", "10000"))
+# Schema-Version jedes Events ("v"); bei inkompatiblen Änderungen erhöhen
+EVENT_SCHEMA_VERSION = 1
+EVENTS_BLOCK_MS = int(os.getenv("EVENTS_BLOCK_MS", "5000"))
+EVENTS_READ_COUNT = 500
+RECONNECT_BACKOFF_MAX = 30.0
+
+
+def publish(r, event):
+    """Append an event (dict or JSON string) to the shared stream; works on clients and pipelines."""
+    payload = event if isinstance(event, str) else json.dumps({"v": EVENT_SCHEMA_VERSION, **event}, separators=(",", ":"))
+    return r.xadd(EVENTS_STREAM, {"data": payload}, maxlen=EVENTS_MAXLEN, approximate=True)
+
+
+def _parse_id(stream_id):
+    ms, _, seq = stream_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class StreamListener:
+    """Reads the event stream with XREAD from this instance's own offset.
+
+    Every API replica runs one listener and serves its own sockets. The offset
+    survives reconnects, so events published while Redis was unreachable are
+    delivered afterwards; if they were already trimmed, ``on_gap`` is called
+    so clients can resync.
+    """
+
+    def __init__(self, redis_url, on_event, on_gap=None):
+        self.redis_url = redis_url
+        self.on_event = on_event
+        self.on_gap = on_gap
+        self.last_id = None
+        self.connected = False
+        self.reconnects = 0
+        self.delivered = 0
+        self.gaps = 0
+
+    async def _check_gap(self, r):
+        first = await r.xrange(EVENTS_STREAM, count=1)
+        if first and self.last_id and _parse_id(first[0][0]) > _parse_id(self.last_id):
+            # Unser Offset liegt vor dem ältesten Eintrag: dazwischen wurde getrimmt
+            self.gaps += 1
+            logger.warning(f"Event stream trimmed past offset {self.last_id}, clients need a resync.")
+            if self.on_gap:
+                self.on_gap()
+
+    async def _read(self, r):
+        if self.last_id is None:
+            # Erster Start: ab dem aktuellen Ende lesen
+            latest = await r.xrevrange(EVENTS_STREAM, count=1)
+            self.last_id = latest[0][0] if latest else "0-0"
+        else:
+            await self._check_gap(r)
+        self.connected = True
+        logger.info(f"✅ Reading event stream '{EVENTS_STREAM}' from {self.last_id}")
+
+        while True:
+            entries = await r.xread({EVENTS_STREAM: self.last_id}, block=EVENTS_BLOCK_MS, count=EVENTS_READ_COUNT)
+            for _, messages in entries or []:
+                for message_id, fields in messages:
+                    self.last_id = message_id
+                    payload = fields.get("data")
+                    if payload:
+                        self.delivered += 1
+                        self.on_event(payload)
+
+    async def run(self):
+        backoff = 1.0
+        while True:
+            r = redis_async.from_url(
+                self.redis_url, decode_responses=True, health_check_interval=30, socket_keepalive=True,
+                socket_timeout=EVENTS_BLOCK_MS / 1000 + 10,
+            )
+            try:
+                await self._read(r)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.connected:
+                    # Verbindung lief schon: Backoff von vorn beginnen
+                    backoff = 1.0
+                self.connected = False
+                self.reconnects += 1
+                delay = random.uniform(0, backoff)
+                logger.error(f"Event stream listener failed ({type(e).__name__}: {e}), reconnecting in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                backoff = min(RECONNECT_BACKOFF_MAX, backoff * 2)
+            finally:
+                self.connected = False
+                await r.close()
+
+    def metrics(self):
+        return {
+            "stream": EVENTS_STREAM,
+            "connected": self.connected,
+            "last_id": self.last_id,
+            "delivered": self.delivered,
+            "reconnects": self.reconnects,
+            "gaps": self.gaps,
+        }
@@ -0,0 +1,180 @@
+import os
+import json
+import base64
+import hashlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, tuple_
+
+from database import JobEntry
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Rückblick für den Change-Feed: now() ist der Transaktionsstart, späte Commits landen "in der Vergangenheit"
+CHANGES_OVERLAP_SECONDS = float(os.getenv("JOBS_CHANGES_OVERLAP_SECONDS", "30"))
+
+# Wird bei Löschungen (Reset) erhöht, damit Clients neu laden statt Deltas anzuwenden
+GENERATION_KEY = "jobs:generation"
+
+# Schlanke Listenansicht: ohne description und application_draft
+LIST_COLUMNS = (
+    JobEntry.id,
+    JobEntry.title,
+    JobEntry.company,
+    JobEntry.match_score,
+    JobEntry.reasoning,
+    JobEntry.url,
+    JobEntry.created_at,
+    JobEntry.status,
+    JobEntry.generation_error,
+    JobEntry.local_score,
+    JobEntry.score_source,
+    JobEntry.updated_at,
+    JobEntry.application_draft.isnot(None).label("has_application"),
+)
+
+# Sortierung -> Keyset-Spalte (immer zusammen mit id als Tie-Breaker)
+SORT_COLUMNS = {
+    "score": JobEntry.match_score,
+    "date": JobEntry.created_at,
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort, value, job_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, job_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, job_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if cursor_sort != sort:
+            raise InvalidCursor(f"Cursor belongs to sort '{cursor_sort}'")
+        if sort == "date" and value is not None:
+            value = datetime.fromisoformat(value)
+        return value, str(job_id)
+    except InvalidCursor:
+        raise
+    except Exception as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
+
+
+def row_to_dict(row):
+    item = dict(row._mapping)
+    for key in ("created_at", "updated_at"):
+        if item.get(key):
+            item[key] = item[key].isoformat()
+    return item
+
+
+# db = AsyncSession, r = redis.asyncio Client (nur von der API genutzt)
+
+async def get_generation(r):
+    return int(await r.get(GENERATION_KEY) or 0)
+
+
+async def bump_generation(r):
+    return await r.incr(GENERATION_KEY)
+
+
+async def last_change(db):
+    # max() über den (updated_at, id) Index: ein Index-Lookup statt Tabellenscan
+    return await db.scalar(select(func.max(JobEntry.updated_at)))
+
+
+async def list_etag(db, r, **params):
+    """Weak ETag for a /jobs page: changes whenever any row changes or jobs were deleted."""
+    changed = await last_change(db)
+    key = json.dumps([await get_generation(r), changed.isoformat() if changed else None, params], sort_keys=True, default=str)
+    return f'W/"{hashlib.sha1(key.encode("utf-8")).hexdigest()}"'
+
+
+def encode_changes_cursor(generation, changed_at, job_id=None):
+    # job_id gesetzt = Folgeseite (strikter Keyset), sonst neuer Abruf mit Überlappung
+    raw = json.dumps([generation, changed_at.isoformat() if changed_at else None, job_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_changes_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        generation, changed_at, job_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return int(generation), datetime.fromisoformat(changed_at) if changed_at else None, job_id
+    except Exception as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
+
+
+async def changes_cursor(db, r):
+    """Cursor for 'everything from now on'; take it before reading a snapshot."""
+    return encode_changes_cursor(await get_generation(r), await last_change(db))
+
+
+async def list_changes(db, r, since, limit=MAX_PAGE_SIZE):
+    """Rows inserted or updated since ``since``; clients merge them by id."""
+    generation, changed_at, job_id = decode_changes_cursor(since)
+    current_generation = await get_generation(r)
+    if generation != current_generation:
+        # Jobs wurden gelöscht: Delta reicht nicht, Client muss neu laden
+        return {"items": [], "cursor": await changes_cursor(db, r), "has_more": False, "reset": True}
+
+    query = select(*LIST_COLUMNS)
+    if changed_at is not None:
+        if job_id is not None:
+            query = query.where(tuple_(JobEntry.updated_at, JobEntry.id) > tuple_(changed_at, job_id))
+        else:
+            query = query.where(JobEntry.updated_at > changed_at - timedelta(seconds=CHANGES_OVERLAP_SECONDS))
+
+    rows = (await db.execute(query.order_by(JobEntry.updated_at, JobEntry.id).limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if has_more:
+        last = rows[-1]
+        cursor = encode_changes_cursor(generation, last.updated_at, last.id)
+    else:
+        newest = max((row.updated_at for row in rows if row.updated_at), default=changed_at)
+        cursor = encode_changes_cursor(generation, newest)
+    return {"items": [row_to_dict(row) for row in rows], "cursor": cursor, "has_more": has_more, "reset": False}
+
+
+async def list_jobs(db, sort="score", cursor=None, limit=DEFAULT_PAGE_SIZE, statuses=None):
+    """One page of the slim job list; returns (items, next_cursor).
+
+    Rows without a sort value come last. Postgres sorts NULLs first in DESC
+    order and a row comparison with NULL is never true, so they are paged
+    separately by id after the last non-NULL row.
+    """
+    sort_column = SORT_COLUMNS[sort]
+    base = select(*LIST_COLUMNS)
+    if statuses:
+        base = base.where(JobEntry.status.in_(statuses))
+    value, job_id = decode_cursor(cursor, sort) if cursor else (None, None)
+
+    rows = []
+    if not cursor or value is not None:
+        query = base.where(sort_column.isnot(None))
+        if cursor:
+            # Row-Vergleich nutzt den (spalte, id) Index statt OFFSET
+            query = query.where(tuple_(sort_column, JobEntry.id) < tuple_(value, job_id))
+        rows = (await db.execute(query.order_by(sort_column.desc(), JobEntry.id.desc()).limit(limit + 1))).all()
+    if len(rows) <= limit:
+        # NULL-Werte am Ende: eigener Keyset nur über id
+        query = base.where(sort_column.is_(None))
+        if cursor and value is None:
+            query = query.where(JobEntry.id < job_id)
+        rows += (await db.execute(query.order_by(JobEntry.id.desc()).limit(limit + 1 - len(rows)))).all()
+
+    items = [row_to_dict(row) for row in rows[:limit]]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(sort, getattr(last, sort_column.key), last.id)
+    return items, next_cursor
@@ -0,0 +1,146 @@
+import logging
+
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from database import JobEntry
+import seen_urls
+import events
+
+logger = logging.getLogger(__name__)
+
+# Bei Konflikten überschreiben; status, application_draft und created_at bleiben unangetastet
+UPDATE_COLUMNS = ("title", "company", "description", "match_score", "reasoning", "content_hash", "local_score", "score_source")
+
+# Job-IDs, für die schon ein new_job verschickt wurde
+ANNOUNCED_KEY = "jobs:announced"
+
+
+def job_row(job_data, data):
+    """Row for the jobs table from the scraped job and its analysis result."""
+    return {
+        "id": job_data['id'],
+        "title": job_data['title'],
+        "company": job_data['company'],
+        "description": job_data['description'],
+        "match_score": float(data.get("score", 0)),
+        "url": job_data.get('url'),
+        "reasoning": data.get("reason_de", ""),
+        "status": "OPEN",
+        "content_hash": job_data.get('content_hash'),
+        "local_score": job_data.get('local_score'),
+        "score_source": data.get("score_source", "llm"),
+    }
+
+
+def _dedupe(rows):
+    # ON CONFLICT DO UPDATE darf eine Zeile nur einmal pro Statement treffen: letzter Stand gewinnt
+    latest = {}
+    for row in rows:
+        latest.pop(row["id"], None)
+        latest[row["id"]] = row
+    return list(latest.values())
+
+
+def _upsert_statement(rows):
+    stmt = insert(JobEntry).values(rows)
+    excluded = stmt.excluded
+    update = {column: excluded[column] for column in UPDATE_COLUMNS}
+    update["url"] = func.coalesce(excluded.url, JobEntry.url)
+    update["updated_at"] = func.now()
+    # xmax = 0 -> Zeile wurde neu eingefügt, sonst aktualisiert
+    return stmt.on_conflict_do_update(index_elements=["id"], set_=update).returning(
+        JobEntry.id, JobEntry.created_at, literal_column("(xmax = 0)").label("inserted")
+    )
+
+
+def upsert_jobs(db, rows):
+    """Write rows with one multi-row INSERT ... ON CONFLICT (id) DO UPDATE.
+
+    Returns (stored, failed): stored is [(row, inserted, created_at)], failed the
+    rows rejected by the database. Connection errors propagate so the caller can
+    re-queue the whole batch.
+    """
+    rows = _dedupe(rows)
+    try:
+        result = db.execute(_upsert_statement(rows)).all()
+        db.commit()
+    except OperationalError:
+        db.rollback()
+        raise
+    except DBAPIError as e:
+        # Einzelne kaputte Zeile soll nicht den ganzen Batch blockieren
+        db.rollback()
+        logger.warning(f"Bulk upsert of {len(rows)} jobs failed ({e.__class__.__name__}), isolating rows.")
+        return _upsert_one_by_one(db, rows)
+
+    by_id = {row["id"]: row for row in rows}
+    return [(by_id[item.id], item.inserted, item.created_at) for item in result], []
+
+
+def _upsert_one_by_one(db, rows):
+    stored, failed = [], []
+    for row in rows:
+        try:
+            item = db.execute(_upsert_statement([row])).one()
+            db.commit()
+            stored.append((row, item.inserted, item.created_at))
+        except OperationalError:
+            db.rollback()
+            raise
+        except DBAPIError as e:
+            db.rollback()
+            logger.error(f"Job {row['id']} rejected by database: {e}")
+            failed.append(row)
+    return stored, failed
+
+
+def job_summary(row, created_at):
+    """Compact new_job payload: list fields only, description is fetched via GET /jobs/{id}."""
+    return {
+        "id": row["id"],
+        "title": row["title"],
+        "company": row["company"],
+        "match_score": row["match_score"],
+        "reasoning": row["reasoning"],
+        "url": row["url"],
+        "status": "OPEN",
+        "local_score": row["local_score"],
+        "score_source": row["score_source"],
+        "has_application": False,
+        "created_at": created_at.isoformat() if created_at else None
+    }
+
+
+def publish_stored(r, stored):
+    # Nicht xmax entscheidet über new_job, sondern ob der Job schon angekündigt wurde: nach einem
+    # Absturz zwischen Commit und Ack sieht der Replay die Zeile als Update, der Client kennt sie aber nicht
+    if not stored:
+        return
+    announced = r.smismember(ANNOUNCED_KEY, [row["id"] for row, _, _ in stored])
+    pipe = r.pipeline()
+    for (row, inserted, created_at), known in zip(stored, announced):
+        if inserted or not known:
+            event = {"type": "new_job", "job": job_summary(row, created_at)}
+        else:
+            # Neu bewertet: nur geänderte Listenfelder, Beschreibung lädt der Client bei Bedarf
+            event = {
+                "type": "job_update",
+                "job_id": row["id"],
+                "title": row["title"],
+                "match_score": row["match_score"],
+                "reasoning": row["reasoning"],
+                "score_source": row["score_source"]
+            }
+        events.publish(pipe, event)
+    pipe.sadd(ANNOUNCED_KEY, *[row["id"] for row, _, _ in stored])
+    pipe.execute()
+
+    for row, _, _ in stored:
+        seen_urls.mark_seen(r, row["url"])
+
+
+def clear_announced(r):
+    # Rückgabe durchreichen, damit auch redis.asyncio Clients awaiten können
+    return r.delete(ANNOUNCED_KEY)
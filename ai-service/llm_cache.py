@@ -0,0 +1,154 @@
+import os
+import json
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import redis
+from sqlalchemy.dialects.postgresql import insert
+
+from celery_config import REDIS_URL
+from database import SessionLocal, LLMCacheEntry
+import llm_gateway
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+# Aus Redis verdrängte Einträge nach Postgres auslagern statt sie zu verwerfen
+LLM_CACHE_PG_SPILL = os.getenv("LLM_CACHE_PG_SPILL", "false").lower() == "true"
+
+KEY_PREFIX = "llmcache:"
+INDEX_KEY = "llmcache:index"
+STATS_KEY = "llmcache:stats"
+
+r = redis.from_url(REDIS_URL, decode_responses=True)
+
+
+def parse_json_response(content):
+    return json.loads(content.strip().replace("```json", "").replace("```", ""))
+
+
+def cache_key(model, messages, params):
+    raw = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True, ensure_ascii=False)
+    return KEY_PREFIX + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _stat(call_site, outcome):
+    try:
+        r.hincrby(STATS_KEY, f"{call_site}:{outcome}", 1)
+    except Exception as e:
+        logger.debug(f"LLM cache stats unavailable: {e}")
+
+
+def _load_spilled(key):
+    db = SessionLocal()
+    try:
+        min_created = datetime.now(timezone.utc) - timedelta(seconds=LLM_CACHE_TTL)
+        entry = db.query(LLMCacheEntry).filter(LLMCacheEntry.key == key, LLMCacheEntry.created_at >= min_created).first()
+        return entry.content if entry else None
+    finally:
+        db.close()
+
+
+def _spill(items):
+    db = SessionLocal()
+    try:
+        db.execute(insert(LLMCacheEntry).values(items).on_conflict_do_nothing(index_elements=["key"]))
+        db.commit()
+    finally:
+        db.close()
+
+
+def prune_spilled():
+    """Delete spilled entries older than LLM_CACHE_TTL; returns the number of rows removed."""
+    db = SessionLocal()
+    try:
+        min_created = datetime.now(timezone.utc) - timedelta(seconds=LLM_CACHE_TTL)
+        removed = db.query(LLMCacheEntry).filter(LLMCacheEntry.created_at < min_created).delete(synchronize_session=False)
+        db.commit()
+        return removed
+    finally:
+        db.close()
+
+
+def _evict_overflow():
+    overflow = r.zcard(INDEX_KEY) - LLM_CACHE_MAX_ENTRIES
+    if overflow <= 0:
+        return
+    keys = [key for key, _ in r.zpopmin(INDEX_KEY, overflow)]
+    if LLM_CACHE_PG_SPILL:
+        values = r.mget(keys)
+        items = [{"key": k, "content": v} for k, v in zip(keys, values) if v is not None]
+        if items:
+            try:
+                _spill(items)
+            except Exception as e:
+                logger.warning(f"LLM cache spill to Postgres failed: {e}")
+    r.delete(*keys)
+    logger.debug(f"Evicted {len(keys)} LLM cache entries.")
+
+
+def _store(key, content):
+    pipe = r.pipeline()
+    pipe.setex(key, LLM_CACHE_TTL, content)
+    pipe.zadd(INDEX_KEY, {key: time.time()})
+    pipe.zremrangebyscore(INDEX_KEY, 0, time.time() - LLM_CACHE_TTL)
+    pipe.execute()
+    _evict_overflow()
+
+
+def cached_completion(call_site, model, messages, parse=None, cache=True, **params):
+    """Run a chat completion through the response cache.
+
+    Returns ``parse(content)`` (or the raw content). A response is only
+    cached if ``parse`` accepted it, so broken answers are retried.
+    ``cache=False`` bypasses the cache for non-deterministic calls.
+    """
+    use_cache = cache and LLM_CACHE_ENABLED
+    key = cache_key(model, messages, params) if use_cache else None
+
+    if use_cache:
+        try:
+            content = r.get(key)
+            if content is None and LLM_CACHE_PG_SPILL:
+                content = _load_spilled(key)
+                if content is not None:
+                    _store(key, content)
+        except Exception as e:
+            logger.warning(f"LLM cache lookup failed ({call_site}): {e}")
+            content = None
+        if content is not None:
+            try:
+                result = parse(content) if parse else content
+                _stat(call_site, "hit")
+                logger.info(f"💾 LLM cache hit ({call_site})")
+                return result
+            except Exception:
+                logger.warning(f"Discarding unparsable LLM cache entry ({call_site}).")
+        _stat(call_site, "miss")
+    else:
+        _stat(call_site, "bypass")
+
+    content = llm_gateway.chat_sync(call_site, model, messages, **params)
+    result = parse(content) if parse else content
+
+    if use_cache:
+        try:
+            _store(key, content)
+        except Exception as e:
+            logger.warning(f"LLM cache store failed ({call_site}): {e}")
+    return result
+
+
+def get_stats():
+    stats = {}
+    for field, value in r.hgetall(STATS_KEY).items():
+        call_site, outcome = field.rsplit(":", 1)
+        stats.setdefault(call_site, {"hit": 0, "miss": 0, "bypass": 0})[outcome] = int(value)
+    for site in stats.values():
+        lookups = site["hit"] + site["miss"]
+        site["hit_rate"] = round(site["hit"] / lookups, 4) if lookups else None
+    return {"entries": r.zcard(INDEX_KEY), "call_sites": stats}
@@ -0,0 +1,261 @@
+import os
+import asyncio
+import logging
+import random
+import threading
+import time
+import uuid
+
+import openai
+import redis.asyncio as redis_async
+from openai import AsyncOpenAI
+
+from celery_config import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RATE_PER_SEC = float(os.getenv("LLM_RATE_PER_SEC", "2"))
+LLM_BURST = int(os.getenv("LLM_BURST", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+# Max. Dauer eines Slots, falls ein Prozess ihn nicht mehr freigibt
+LLM_LEASE_SECONDS = int(os.getenv("LLM_LEASE_SECONDS", str(int(LLM_TIMEOUT) + 30)))
+
+INFLIGHT_KEY = "llm:inflight"
+BUCKET_KEY = "llm:bucket"
+METRICS_KEY = "metrics:llm"
+
+_ACQUIRE_SLOT_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[4])
+    return 1
+end
+return 0
+"""
+
+# Token Bucket: liefert 0 wenn ein Token genommen wurde, sonst die Wartezeit in ms
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], 60000)
+return wait
+"""
+
+
+class _LoopClients:
+    # OpenAI- und Redis-Clients sind an ihre Event-Loop gebunden
+    def __init__(self):
+        self.openai = AsyncOpenAI(
+            base_url="https://openrouter.ai/api/v1",
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=0,
+            timeout=LLM_TIMEOUT,
+        )
+        self.redis = redis_async.from_url(REDIS_URL, decode_responses=True)
+        self.acquire_slot = self.redis.register_script(_ACQUIRE_SLOT_SCRIPT)
+        self.take_token = self.redis.register_script(_TOKEN_BUCKET_SCRIPT)
+
+
+_clients = {}
+
+
+def _get_clients():
+    key = (os.getpid(), id(asyncio.get_running_loop()))
+    clients = _clients.get(key)
+    if clients is None:
+        clients = _clients[key] = _LoopClients()
+    return clients
+
+
+def _is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_delay(error, attempt):
+    retry_after = None
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            retry_after = None
+    backoff = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt))
+    # Full Jitter, damit nicht alle Worker gleichzeitig erneut anfragen
+    delay = random.uniform(0, backoff)
+    return max(delay, retry_after or 0)
+
+
+async def _acquire(clients):
+    # Erst den Slot, dann das Token: nur wer wirklich senden darf, nimmt Tokens aus dem Bucket
+    token = uuid.uuid4().hex
+    while not await clients.acquire_slot(
+        keys=[INFLIGHT_KEY], args=[time.time(), LLM_MAX_CONCURRENCY, LLM_LEASE_SECONDS, token]
+    ):
+        await asyncio.sleep(random.uniform(0.05, 0.25))
+    try:
+        while True:
+            wait_ms = await clients.take_token(keys=[BUCKET_KEY], args=[LLM_RATE_PER_SEC, LLM_BURST])
+            if not wait_ms:
+                return token
+            await asyncio.sleep(wait_ms / 1000 + random.uniform(0, 0.05))
+    except BaseException:
+        await clients.redis.zrem(INFLIGHT_KEY, token)
+        raise
+
+
+async def _record(clients, call_site, **values):
+    try:
+        pipe = clients.redis.pipeline()
+        for field, value in values.items():
+            if isinstance(value, float):
+                pipe.hincrbyfloat(METRICS_KEY, f"{call_site}:{field}", value)
+            else:
+                pipe.hincrby(METRICS_KEY, f"{call_site}:{field}", value)
+        await pipe.execute()
+    except Exception as e:
+        logger.debug(f"LLM metrics unavailable: {e}")
+
+
+async def chat(call_site, model, messages, **params):
+    """Rate-limited chat completion with retries; returns the message content."""
+    clients = _get_clients()
+    attempt = 0
+    while True:
+        queued_at = time.time()
+        token = await _acquire(clients)
+        started_at = time.time()
+        try:
+            response = await clients.openai.chat.completions.create(model=model, messages=messages, **params)
+            finished_at = time.time()
+            await _record(
+                clients, call_site, calls=1,
+                queue_wait_ms=(started_at - queued_at) * 1000, latency_ms=(finished_at - started_at) * 1000,
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= LLM_MAX_RETRIES:
+                await _record(clients, call_site, errors=1)
+                raise
+            delay = _retry_delay(e, attempt)
+            attempt += 1
+            logger.warning(f"LLM call ({call_site}) failed with {type(e).__name__}, retry {attempt}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+            await _record(clients, call_site, retries=1)
+        finally:
+            await clients.redis.zrem(INFLIGHT_KEY, token)
+        await asyncio.sleep(delay)
+
+
+async def stream_chat(call_site, model, messages, on_delta, **params):
+    """Streamed chat completion; calls ``on_delta(text)`` per token chunk and returns the full content.
+
+    Retries only happen before the first token arrived, otherwise the
+    consumer would see the beginning twice.
+    """
+    clients = _get_clients()
+    attempt = 0
+    while True:
+        queued_at = time.time()
+        token = await _acquire(clients)
+        started_at = time.time()
+        first_token_at = None
+        parts = []
+        try:
+            stream = await clients.openai.chat.completions.create(model=model, messages=messages, stream=True, **params)
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.time()
+                parts.append(delta)
+                on_delta(delta)
+            finished_at = time.time()
+            await _record(
+                clients, call_site, calls=1, streams=1,
+                queue_wait_ms=(started_at - queued_at) * 1000, latency_ms=(finished_at - started_at) * 1000,
+                ttft_ms=((first_token_at or finished_at) - started_at) * 1000,
+            )
+            return "".join(parts)
+        except Exception as e:
+            if first_token_at is not None or not _is_retryable(e) or attempt >= LLM_MAX_RETRIES:
+                await _record(clients, call_site, errors=1)
+                raise
+            delay = _retry_delay(e, attempt)
+            attempt += 1
+            logger.warning(f"LLM stream ({call_site}) failed with {type(e).__name__}, retry {attempt}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+            await _record(clients, call_site, retries=1)
+        finally:
+            await clients.redis.zrem(INFLIGHT_KEY, token)
+        await asyncio.sleep(delay)
+
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    # Eine langlebige Event-Loop pro Prozess, damit Verbindungen über Tasks hinweg wiederverwendet werden
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="llm-gateway", daemon=True).start()
+        return _loop
+
+
+def chat_sync(call_site, model, messages, **params):
+    """Blocking wrapper around ``chat`` for Celery tasks and other sync callers."""
+    future = asyncio.run_coroutine_threadsafe(chat(call_site, model, messages, **params), _background_loop())
+    return future.result()
+
+
+def stream_chat_sync(call_site, model, messages, on_delta, **params):
+    """Blocking wrapper around ``stream_chat``; ``on_delta`` runs on the gateway loop thread."""
+    future = asyncio.run_coroutine_threadsafe(stream_chat(call_site, model, messages, on_delta, **params), _background_loop())
+    return future.result()
+
+
+async def get_metrics():
+    clients = _get_clients()
+    raw = await clients.redis.hgetall(METRICS_KEY)
+    sites = {}
+    for field, value in raw.items():
+        call_site, metric = field.rsplit(":", 1)
+        sites.setdefault(call_site, {})[metric] = float(value)
+    for values in sites.values():
+        calls = values.get("calls", 0)
+        if calls:
+            values["avg_queue_wait_ms"] = round(values.get("queue_wait_ms", 0) / calls, 1)
+            values["avg_latency_ms"] = round(values.get("latency_ms", 0) / calls, 1)
+        if values.get("streams"):
+            values["avg_ttft_ms"] = round(values.get("ttft_ms", 0) / values["streams"], 1)
+    return {
+        "in_flight": await clients.redis.zcard(INFLIGHT_KEY),
+        "max_concurrency": LLM_MAX_CONCURRENCY,
+        "rate_per_sec": LLM_RATE_PER_SEC,
+        "call_sites": sites,
+    }
@@ -0,0 +1,28 @@
+"""Add content_hash to jobs
+
+Revision ID: 3c1e7a9b42d0
+Revises: 845ac55da830
+Create Date: 2026-10-17 10:12:41.381920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1e7a9b42d0'
+down_revision: Union[str, Sequence[str], None] = '845ac55da830'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('jobs', sa.Column('content_hash', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('jobs', 'content_hash')
@@ -0,0 +1,33 @@
+"""Add llm_cache table
+
+Revision ID: 9f2d6b81c5e3
+Revises: 3c1e7a9b42d0
+Create Date: 2026-10-17 11:03:17.552804
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f2d6b81c5e3'
+down_revision: Union[str, Sequence[str], None] = '3c1e7a9b42d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('llm_cache',
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('llm_cache')
@@ -0,0 +1,30 @@
+"""Add local_score and score_source to jobs
+
+Revision ID: b7e4f0a2d913
+Revises: 9f2d6b81c5e3
+Create Date: 2026-10-17 12:20:05.117436
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e4f0a2d913'
+down_revision: Union[str, Sequence[str], None] = '9f2d6b81c5e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('jobs', sa.Column('local_score', sa.Float(), nullable=True))
+    op.add_column('jobs', sa.Column('score_source', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('jobs', 'score_source')
+    op.drop_column('jobs', 'local_score')
@@ -0,0 +1,28 @@
+"""Add llm_cache created_at index
+
+Revision ID: c4a9e7d1b058
+Revises: f8c06d2e4b91
+Create Date: 2026-10-17 15:42:08.317604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a9e7d1b058'
+down_revision: Union[str, Sequence[str], None] = 'f8c06d2e4b91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_llm_cache_created_at', 'llm_cache', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_llm_cache_created_at', table_name='llm_cache')
@@ -0,0 +1,28 @@
+"""Add version to user_settings
+
+Revision ID: d2a8c4f17e60
+Revises: b7e4f0a2d913
+Create Date: 2026-10-17 12:41:37.602118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a8c4f17e60'
+down_revision: Union[str, Sequence[str], None] = 'b7e4f0a2d913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_settings', sa.Column('version', sa.Integer(), nullable=True, server_default='1'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('user_settings', 'version')
@@ -0,0 +1,34 @@
+"""Add keyset pagination indexes to jobs
+
+Revision ID: e5b13f9a7c24
+Revises: d2a8c4f17e60
+Create Date: 2026-10-17 13:02:48.219573
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b13f9a7c24'
+down_revision: Union[str, Sequence[str], None] = 'd2a8c4f17e60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_jobs_match_score_id', 'jobs', ['match_score', 'id'], unique=False)
+    op.create_index('ix_jobs_created_at_id', 'jobs', ['created_at', 'id'], unique=False)
+    op.create_index('ix_jobs_status_match_score_id', 'jobs', ['status', 'match_score', 'id'], unique=False)
+    op.create_index('ix_jobs_status_created_at_id', 'jobs', ['status', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_jobs_status_created_at_id', table_name='jobs')
+    op.drop_index('ix_jobs_status_match_score_id', table_name='jobs')
+    op.drop_index('ix_jobs_created_at_id', table_name='jobs')
+    op.drop_index('ix_jobs_match_score_id', table_name='jobs')
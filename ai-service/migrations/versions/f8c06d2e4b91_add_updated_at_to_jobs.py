@@ -0,0 +1,31 @@
+"""Add updated_at to jobs
+
+Revision ID: f8c06d2e4b91
+Revises: e5b13f9a7c24
+Create Date: 2026-10-17 13:27:11.840362
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f8c06d2e4b91'
+down_revision: Union[str, Sequence[str], None] = 'e5b13f9a7c24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('jobs', sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True))
+    op.execute("UPDATE jobs SET updated_at = COALESCE(created_at, now())")
+    op.create_index('ix_jobs_updated_at_id', 'jobs', ['updated_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_jobs_updated_at_id', table_name='jobs')
+    op.drop_column('jobs', 'updated_at')
@@ -0,0 +1,38 @@
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+KEY_PREFIX = "pagecache:"
+CLEAR_BATCH_SIZE = 1000
+
+
+# Gemeinsam mit scraper-service/page_cache.py
+def _key(url):
+    return KEY_PREFIX + hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def invalidate(r, url):
+    # Analyse fehlgeschlagen: beim nächsten Crawl nicht als "unverändert" überspringen
+    if not url:
+        return
+    try:
+        r.delete(_key(url))
+    except Exception as e:
+        logger.warning(f"Could not invalidate page cache for {url}: {e}")
+
+
+async def clear_async(r):
+    """Drop all page cache entries (redis.asyncio client), e.g. after /reset."""
+    # Sonst gelten nach einem Reset Listings und Detailseiten weiter als "unverändert"
+    count = 0
+    batch = []
+    async for key in r.scan_iter(match=KEY_PREFIX + "*", count=CLEAR_BATCH_SIZE):
+        batch.append(key)
+        if len(batch) >= CLEAR_BATCH_SIZE:
+            count += await r.unlink(*batch)
+            batch = []
+    if batch:
+        count += await r.unlink(*batch)
+    return count
@@ -0,0 +1,112 @@
+import os
+import json
+import hashlib
+from datetime import date
+from io import BytesIO
+
+import markdown
+from xhtml2pdf import pisa
+
+# Bei Änderungen am HTML/CSS erhöhen, damit alte PDFs nicht mehr aus dem Cache kommen
+TEMPLATE_VERSION = "1"
+PDF_CACHE_TTL = int(os.getenv("PDF_CACHE_TTL", str(7 * 24 * 3600)))
+PDF_RENDER_PROCESSES = int(os.getenv("PDF_RENDER_PROCESSES", "2"))
+
+KEY_PREFIX = "pdfcache:"
+
+
+def today_str():
+    return date.today().strftime("%d.%m.%Y")
+
+
+def cache_key(application_draft, company, location, today):
+    # Alles, was im PDF landet: Entwurf, Profil (Ort), Firma, Datum und Template-Version
+    raw = json.dumps([TEMPLATE_VERSION, application_draft, company or "", location or "", today], ensure_ascii=False)
+    return KEY_PREFIX + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# r muss ohne decode_responses erzeugt sein (Binärdaten); Rückgabe durchreichen für redis.asyncio
+def get_cached(r, key):
+    return r.get(key)
+
+
+def store(r, key, pdf_bytes):
+    return r.set(key, pdf_bytes, ex=PDF_CACHE_TTL)
+
+
+def render_pdf(application_draft, company, location, today_str):
+    """Render the cover letter as PDF bytes. CPU-bound: run it in a process pool or a worker."""
+    html_content = markdown.markdown(application_draft)
+
+    applicant_name = "Dein Name"
+    
+    full_html = f"""
+    <html>
+    <head>
+        <style>
+            @page {{
+                size: A4;
+                margin: 2.5cm 2cm 2cm 2.5cm; /* Standard Rand */
+            }}
+            body {{
+                font-family: Helvetica, Arial, sans-serif;
+                font-size: 11pt;
+                line-height: 1.5;
+                color: #000;
+            }}
+            .header {{
+                margin-bottom: 2cm;
+                font-size: 9pt;
+                color: #555;
+                border-bottom: 1px solid #ccc;
+                padding-bottom: 10px;
+            }}
+            .sender {{
+                font-size: 8pt;
+                text-decoration: underline;
+                margin-bottom: 1cm;
+            }}
+            .meta {{
+                text-align: right;
+                margin-bottom: 1cm;
+            }}
+            .address {{
+                margin-bottom: 2cm;
+                font-size: 11pt;
+            }}
+            .subject {{
+                font-weight: bold;
+                margin-bottom: 1cm;
+                font-size: 12pt;
+            }}
+            .content {{
+                text-align: justify;
+            }}
+        </style>
+    </head>
+    <body>
+        <div class="sender">{applicant_name} • Musterstraße 1 • 12345 Musterstadt</div>
+
+        <div class="meta">
+            {location or "Musterstadt"}, den {today_str}
+        </div>
+
+        <div class="address">
+            {company}<br>
+            Personalabteilung<br>
+            (Adresse unbekannt)
+        </div>
+
+        <div class="content">
+            {html_content}
+        </div>
+    </body>
+    </html>
+    """
+
+    pdf_buffer = BytesIO()
+    pisa_status = pisa.CreatePDF(src=full_html, dest=pdf_buffer)
+
+    if pisa_status.err:
+        raise RuntimeError(f"PDF rendering failed with {pisa_status.err} errors")
+    return pdf_buffer.getvalue()
@@ -0,0 +1,136 @@
+import json
+import hashlib
+import logging
+import threading
+
+from database import SessionLocal, UserProfile
+from relevance import ProfileVector
+
+logger = logging.getLogger(__name__)
+
+PROFILE_VERSION_KEY = "profile:version"
+PROFILE_DATA_KEY = "profile:data"
+NO_PROFILE = "none"
+
+# Prozesslokale Kopie: (version, CachedProfile oder None)
+_local = (None, None)
+_local_lock = threading.Lock()
+
+
+def format_cv_for_prompt(cv_json):
+    if not cv_json:
+        return "Keine detaillierte Erfahrung angegeben."
+
+    lines = ["BERUFLICHE ERFAHRUNG:"]
+    lines += [f"- {exp['role']} bei {exp['company']} ({exp['duration']}): {exp['description']}" for exp in cv_json.get("experience", [])]
+    lines += ["", "PROJEKTE:"]
+    lines += [f"- {proj['name']} (Tech: {proj['tech_stack']}): {proj['description']}" for proj in cv_json.get("projects", [])]
+    lines += ["", "AUSBILDUNG:", cv_json.get("education", "")]
+    return "\n".join(lines)
+
+
+class CachedProfile:
+    def __init__(self, version, role, skills, location, cv_data):
+        self.version = version
+        self.role = role
+        self.skills = skills
+        self.location = location
+        self.cv_data = cv_data or {}
+        self.cv_text = format_cv_for_prompt(self.cv_data)
+        self.prompt = f"Rolle: {role}, Skills: {skills}\nDetails:\n{self.cv_text}"
+        self._vector = None
+
+    @property
+    def vector(self):
+        # Profilvektor für die lokale Vorbewertung, einmal pro Version
+        if self._vector is None:
+            self._vector = ProfileVector.from_profile(self)
+        return self._vector
+
+    def to_redis(self):
+        return {
+            "version": self.version,
+            "role": self.role or "",
+            "skills": self.skills or "",
+            "location": self.location or "",
+            "cv_data": json.dumps(self.cv_data),
+        }
+
+    @classmethod
+    def from_redis(cls, data):
+        return cls(data["version"], data["role"], data["skills"], data["location"], json.loads(data["cv_data"]))
+
+
+def profile_version(profile):
+    content = json.dumps(
+        [profile.role, profile.skills, profile.location, profile.cv_data],
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return f"{profile.version or 0}-{hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _queue_publish(pipe, profile):
+    if profile is None:
+        pipe.delete(PROFILE_DATA_KEY)
+        pipe.set(PROFILE_VERSION_KEY, NO_PROFILE)
+        return None
+
+    cached = CachedProfile(profile_version(profile), profile.role, profile.skills, profile.location, profile.cv_data)
+    pipe.delete(PROFILE_DATA_KEY)
+    pipe.hset(PROFILE_DATA_KEY, mapping=cached.to_redis())
+    pipe.set(PROFILE_VERSION_KEY, cached.version)
+    return cached
+
+
+def publish(r, profile):
+    """Store the rendered profile in Redis and announce its new version (None = deleted)."""
+    pipe = r.pipeline()
+    cached = _queue_publish(pipe, profile)
+    pipe.execute()
+    if cached:
+        logger.info(f"Profile version {cached.version} published.")
+    return cached
+
+
+async def publish_async(r, profile):
+    """``publish`` for redis.asyncio clients (FastAPI endpoints)."""
+    pipe = r.pipeline()
+    cached = _queue_publish(pipe, profile)
+    await pipe.execute()
+    if cached:
+        logger.info(f"Profile version {cached.version} published.")
+    return cached
+
+
+def _decode(data):
+    return {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v) for k, v in data.items()}
+
+
+def get_profile(r):
+    """Rendered profile for prompts; in-process copy first, then Redis, then the database."""
+    global _local
+    version = r.get(PROFILE_VERSION_KEY)
+    if isinstance(version, bytes):
+        version = version.decode()
+
+    local_version, local_profile = _local
+    if version is not None and version == local_version:
+        return local_profile
+
+    if version == NO_PROFILE:
+        profile = None
+    else:
+        data = _decode(r.hgetall(PROFILE_DATA_KEY))
+        if version is not None and data.get("version") == version:
+            profile = CachedProfile.from_redis(data)
+        else:
+            db = SessionLocal()
+            try:
+                profile = publish(r, db.query(UserProfile).filter(UserProfile.id == 1).first())
+            finally:
+                db.close()
+            version = profile.version if profile else NO_PROFILE
+
+    with _local_lock:
+        _local = (version, profile)
+    return profile
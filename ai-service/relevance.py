@@ -0,0 +1,134 @@
+import os
+import re
+import zlib
+
+import numpy as np
+
+# 0 = aus: lokaler Score wird nur mitgeschrieben, bis /analysis/calibration eine Schwelle belegt
+LOCAL_SCORE_THRESHOLD = float(os.getenv("LOCAL_SCORE_THRESHOLD", "0"))
+# Anteil der Jobs unter der Schwelle, die trotzdem zur Kalibrierung ans LLM gehen
+LOCAL_SCORE_AUDIT_RATE = float(os.getenv("LOCAL_SCORE_AUDIT_RATE", "0.05"))
+
+HASH_DIM = 2 ** 16
+# Kosinus-Ähnlichkeit, ab der die Textähnlichkeit als "voll" zählt
+COSINE_SATURATION = 0.3
+SKILL_WEIGHT = 0.6
+
+# Bindestriche trennen: "Python-Entwickler", "Django-Kenntnisse", "machine-learning"
+_TOKEN = re.compile(r"[a-zäöüß0-9][a-zäöüß0-9+#.]*[a-zäöüß0-9+#]|[a-z]", re.I)
+_STOPWORDS = frozenset("""
+und oder der die das den dem des ein eine einer eines einem mit für von zu zum zur im in auf an als auch bei
+sich sie wir ihr du ist sind wird werden hat haben nicht noch mehr sehr über unter aus nach vor bis wie was
+the and or a an of to in on for with at by from as is are be you we our your this that will
+""".split())
+
+
+def tokenize(text):
+    tokens = [t.lower() for t in _TOKEN.findall(text or "")]
+    return [t for t in tokens if t not in _STOPWORDS]
+
+
+def _terms(text):
+    # Unigramme + Bigramme, damit Skills wie "machine learning" matchen
+    tokens = tokenize(text)
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def _bucket(term):
+    return zlib.crc32(term.encode("utf-8")) % HASH_DIM
+
+
+def _skill_terms(skill):
+    # Längere Skills ("continuous integration delivery") matchen, wenn alle ihre Bigramme vorkommen
+    tokens = tokenize(skill)
+    if len(tokens) <= 2:
+        return [" ".join(tokens)] if tokens else []
+    return [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def _vectorize(texts):
+    matrix = np.zeros((len(texts), HASH_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        buckets = np.fromiter((_bucket(t) for t in _terms(text)), dtype=np.int64)
+        if buckets.size:
+            np.add.at(matrix[row], buckets, 1.0)
+    np.log1p(matrix, out=matrix)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def split_skills(skills):
+    return [s.strip().lower() for s in re.split(r"[,;/\n]", skills or "") if s.strip()]
+
+
+class ProfileVector:
+    def __init__(self, role, skills, cv_data):
+        self.skills = [s for s in split_skills(skills) if _skill_terms(s)]
+        cv_data = cv_data or {}
+        parts = [role or "", skills or ""]
+        parts += [f"{e.get('role', '')} {e.get('description', '')}" for e in cv_data.get("experience", [])]
+        parts += [f"{p.get('tech_stack', '')} {p.get('description', '')}" for p in cv_data.get("projects", [])]
+        self.vector = _vectorize([" ".join(parts)])[0]
+        self.skill_buckets = [np.array([_bucket(t) for t in _skill_terms(s)], dtype=np.int64) for s in self.skills]
+
+    @classmethod
+    def from_profile(cls, profile):
+        return cls(profile.role, profile.skills, profile.cv_data)
+
+
+def score_jobs(profile_vector, jobs):
+    """Score jobs against the profile; returns [(score_0_100, matched_skills)] in input order."""
+    if not jobs:
+        return []
+    texts = [f"{job.get('title', '')} {job.get('title', '')} {job.get('description', '')}" for job in jobs]
+    job_matrix = _vectorize(texts)
+    cosine = job_matrix @ profile_vector.vector
+    text_part = np.clip(cosine / COSINE_SATURATION, 0.0, 1.0)
+
+    if profile_vector.skills:
+        present = np.column_stack([(job_matrix[:, buckets] > 0).all(axis=1) for buckets in profile_vector.skill_buckets])
+        coverage = present.mean(axis=1)
+        scores = 100.0 * (SKILL_WEIGHT * coverage + (1 - SKILL_WEIGHT) * text_part)
+        matched = [[s for s, hit in zip(profile_vector.skills, row) if hit] for row in present]
+    else:
+        scores = 100.0 * text_part
+        matched = [[] for _ in jobs]
+    return [(round(float(score), 1), skills) for score, skills in zip(scores, matched)]
+
+
+def local_reason(score, matched, profile_vector):
+    found = ", ".join(matched) if matched else "keine"
+    return (
+        f"Lokale Vorbewertung ({score:.0f}/100): {len(matched)} von {len(profile_vector.skills)} Skills "
+        f"in der Anzeige gefunden ({found}). Unter der Relevanzschwelle, daher keine KI-Analyse."
+    )
+
+
+def calibration_report(pairs, threshold=LOCAL_SCORE_THRESHOLD):
+    """Compare local scores with LLM scores for jobs that have both."""
+    if not pairs:
+        return {"samples": 0}
+    local = np.array([p[0] for p in pairs], dtype=np.float64)
+    llm = np.array([p[1] for p in pairs], dtype=np.float64)
+    correlation = float(np.corrcoef(local, llm)[0, 1]) if len(pairs) > 1 and local.std() and llm.std() else None
+
+    bins = []
+    for low in range(0, 100, 10):
+        mask = (local >= low) & (local < low + 10 if low < 90 else local <= 100)
+        if mask.any():
+            bins.append({"local_range": [low, low + 10], "count": int(mask.sum()), "avg_llm_score": round(float(llm[mask].mean()), 1)})
+
+    below = local < threshold
+    return {
+        "samples": len(pairs),
+        "threshold": threshold,
+        "pearson": round(correlation, 3) if correlation is not None else None,
+        "mean_abs_diff": round(float(np.abs(local - llm).mean()), 1),
+        "bins": bins,
+        "below_threshold": {
+            "count": int(below.sum()),
+            # Jobs, die das LLM gut fand, die lokal aber verworfen worden wären
+            "llm_score_50_plus": int((below & (llm >= 50)).sum()),
+        },
+    }
@@ -0,0 +1,46 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Gemeinsam mit scraper-service/seen_urls.py: URL -> Zeitpunkt der letzten Analyse
+SEEN_URLS_KEY = "jobs:seen_urls"
+SEEN_URLS_READY_KEY = "jobs:seen_urls:ready"
+SEEN_URLS_WARMING_KEY = "jobs:seen_urls:warming"
+
+WARM_CHUNK_SIZE = 5000
+
+
+def mark_seen(r, url, seen_at=None):
+    if not url:
+        return
+    try:
+        r.zadd(SEEN_URLS_KEY, {url: seen_at or time.time()})
+    except Exception as e:
+        logger.warning(f"Could not mark {url} as seen: {e}")
+
+
+def warm_load(r, db, JobEntry):
+    count = 0
+    pipe = r.pipeline()
+    pipe.delete(SEEN_URLS_KEY)
+    batch = {}
+    query = db.query(JobEntry.url, JobEntry.created_at).filter(JobEntry.url.isnot(None))
+    for url, created_at in query.yield_per(WARM_CHUNK_SIZE):
+        batch[url] = created_at.timestamp() if created_at else time.time()
+        if len(batch) >= WARM_CHUNK_SIZE:
+            pipe.zadd(SEEN_URLS_KEY, batch)
+            count += len(batch)
+            batch = {}
+    if batch:
+        pipe.zadd(SEEN_URLS_KEY, batch)
+        count += len(batch)
+    pipe.set(SEEN_URLS_READY_KEY, "1")
+    pipe.delete(SEEN_URLS_WARMING_KEY)
+    pipe.execute()
+    return count
+
+
+def clear(r):
+    # Rückgabe durchreichen, damit auch redis.asyncio Clients awaiten können
+    return r.delete(SEEN_URLS_KEY, SEEN_URLS_READY_KEY, SEEN_URLS_WARMING_KEY)
@@ -0,0 +1,113 @@
+import os
+import re
+import logging
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+ACCEPT = "accept"
+REJECT = "reject"
+
+# Ab so vielen einstimmigen LLM-Entscheidungen gilt ein gelerntes Muster
+LEARN_MIN_VOTES = int(os.getenv("URL_CLASSIFIER_MIN_VOTES", "3"))
+LEARNED_TTL = 90 * 24 * 3600
+STATS_KEY = "metrics:filter_urls"
+
+_JOB_SEGMENT = r"(jobs?|stellen|stellenangebote?|stellenanzeigen?|karriere|career|careers|vacanc(y|ies)|positions?|openings?|jobboerse|job-offers?)"
+_UUID = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+# Numerische Job-ID (keine Jahreszahl) oder UUID
+_JOB_ID = rf"((?<!\d)(?!(19|20)\d\d(?!\d))\d{{3,}}|{_UUID})"
+# Nur eindeutige Detailseiten per Regel annehmen; reine Slugs (/careers/why-join-us) entscheidet LLM oder Gelerntes
+_ACCEPT_PATTERNS = [
+    # /jobs/<slug>-12345, /karriere/stellenangebote/12345, /careers/<uuid>
+    re.compile(rf"/{_JOB_SEGMENT}(/[^/]+)*/[^/]*{_JOB_ID}[^/]*/?$", re.I),
+    # Detail-Marker gängiger ATS: Recruitee /o/<slug>, Workable /j/<code>, Lever /<firma>/<uuid>
+    # (nur UUID: /artikel/12345 oder /shop/10023 sind keine Stellen)
+    re.compile(rf"^(/o/[^/?]+|/j/[0-9a-f]{{6,}}|/[^/]+/{_UUID})/?($|\?)", re.I),
+    # Job-IDs in Query-Parametern
+    re.compile(r"[?&](job_?id|jobid|stelle|posting_?id|req_?id|gh_jid)=\w+", re.I),
+]
+# Nur das letzte Segment zählt: /unternehmen/jobs/123 ist eine Stelle, /jobs/unternehmen nicht
+_REJECT_PATTERNS = [
+    re.compile(
+        r"/(impressum|imprint|datenschutz|privacy|kontakt|contact|about|ueber-uns|uber-uns|news|blog|presse|press|"
+        r"login|anmelden|register|agb|terms|cookies?|sitemap|faq|events?|investor|unternehmen|produkte?|products?|"
+        r"team|standorte|locations|newsletter|search|suche)/?($|\?)",
+        re.I,
+    ),
+    re.compile(r"\.(pdf|jpe?g|png|gif|svg|css|js|xml|zip|docx?)($|\?)", re.I),
+    re.compile(r"^(mailto|tel|javascript):", re.I),
+]
+# Reine Übersichtsseiten (/jobs, /karriere/) sind keine Detailseiten
+_LISTING_ONLY = re.compile(rf"^(/[a-z]{{2}})?(/{_JOB_SEGMENT})+/?$", re.I)
+
+
+def path_template(url):
+    """Shape of a URL used for learned rules, e.g. ``/de/jobs/*`` for ``/de/jobs/senior-dev-123``."""
+    segments = [s for s in urlparse(url).path.split("/") if s]
+    if not segments:
+        return "/"
+    shaped = ["{id}" if re.fullmatch(r"\d+", s) else s.lower() for s in segments[:-1]]
+    return "/" + "/".join(shaped + ["*"])
+
+
+def _learned_key(domain):
+    return f"urlclass:{domain}"
+
+
+def classify_by_rules(url, base_url):
+    parsed = urlparse(url)
+    if url.rstrip("/") == base_url.rstrip("/"):
+        return REJECT
+    target = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+    if any(p.search(target) for p in _REJECT_PATTERNS):
+        return REJECT
+    if any(p.search(target) for p in _ACCEPT_PATTERNS):
+        return ACCEPT
+    if _LISTING_ONLY.match(parsed.path):
+        return REJECT
+    return None
+
+
+def load_learned(r, domain):
+    learned = {}
+    for field, count in r.hgetall(_learned_key(domain)).items():
+        template, decision = field.rsplit("|", 1)
+        learned.setdefault(template, {ACCEPT: 0, REJECT: 0})[decision] = int(count)
+    return learned
+
+
+# Zu allgemein, um daraus Regeln abzuleiten
+_GENERIC_TEMPLATES = {"/", "/*"}
+
+
+def classify_by_learned(url, learned):
+    votes = learned.get(path_template(url))
+    if not votes:
+        return None
+    if votes[ACCEPT] >= LEARN_MIN_VOTES and votes[REJECT] == 0:
+        return ACCEPT
+    if votes[REJECT] >= LEARN_MIN_VOTES and votes[ACCEPT] == 0:
+        return REJECT
+    return None
+
+
+def learn(r, domain, decisions):
+    """Record LLM decisions ({url: accept/reject}) as votes for their path template."""
+    if not decisions:
+        return
+    pipe = r.pipeline()
+    for url, decision in decisions.items():
+        if path_template(url) in _GENERIC_TEMPLATES:
+            continue
+        pipe.hincrby(_learned_key(domain), f"{path_template(url)}|{decision}", 1)
+    pipe.expire(_learned_key(domain), LEARNED_TTL)
+    pipe.execute()
+
+
+def record_stats(r, stats):
+    pipe = r.pipeline()
+    for field, value in stats.items():
+        if value:
+            pipe.hincrby(STATS_KEY, field, value)
+    pipe.execute()
@@ -1,13 +1,30 @@
 import os
 import json
 import logging
-import io
 import sys
-from openai import OpenAI
-from pypdf import PdfReader
+import random
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 import redis
-from celery_config import celery_app
-from database import SessionLocal, JobEntry, UserProfile, SettingsData
+from celery.signals import worker_ready, worker_process_init, worker_process_shutdown, task_postrun
+from celery_config import celery_app, REDIS_URL
+from database import SessionLocal, JobEntry, POOL_METRICS_KEY, reset_engine_after_fork, pool_stats
+import seen_urls
+import events
+import crawl_runs
+import page_cache
+import llm_cache
+from llm_cache import cached_completion, parse_json_response
+import url_classifier
+from batch_queue import RedisBatchQueue
+from job_sink import job_row, upsert_jobs, publish_stored
+import profile_cache
+import llm_gateway
+import pdf_renderer
+import cv_ingest
+from relevance import score_jobs, local_reason, LOCAL_SCORE_THRESHOLD, LOCAL_SCORE_AUDIT_RATE
 
 # Logging Setup
 logging.basicConfig(
@@ -19,56 +36,309 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENAI_API_KEY"),
-)
 
+POOL_STATS_INTERVAL = float(os.getenv("DB_POOL_STATS_INTERVAL", "10"))
+_pool_stats_published_at = 0.0
 
-def format_cv_for_prompt(cv_json):
-    if not cv_json:
-        return "Keine detaillierte Erfahrung angegeben."
-    
-    text = "BERUFLICHE ERFAHRUNG:\n"
-    for exp in cv_json.get("experience", []):
-        text += f"- {exp['role']} bei {exp['company']} ({exp['duration']}): {exp['description']}\n"
-    
-    text += "\nPROJEKTE:\n"
-    for proj in cv_json.get("projects", []):
-        text += f"- {proj['name']} (Tech: {proj['tech_stack']}): {proj['description']}\n"
-        
-    text += f"\nAUSBILDUNG:\n{cv_json.get('education', '')}"
-    return text
+
+def _pool_stats_field():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+@worker_process_init.connect
+def reset_db_pool(**kwargs):
+    # Prefork: vom Parent geerbte Verbindungen nicht weiterverwenden
+    reset_engine_after_fork()
+
+@worker_process_shutdown.connect
+def drop_db_pool_stats(**kwargs):
+    try:
+        redis.from_url(REDIS_URL).hdel(POOL_METRICS_KEY, _pool_stats_field())
+    except Exception as e:
+        logger.debug(f"Could not remove pool stats: {e}")
+
+@task_postrun.connect
+def publish_db_pool_stats(**kwargs):
+    global _pool_stats_published_at
+    now = time.time()
+    if now - _pool_stats_published_at < POOL_STATS_INTERVAL:
+        return
+    _pool_stats_published_at = now
+    try:
+        redis.from_url(REDIS_URL).hset(POOL_METRICS_KEY, _pool_stats_field(), json.dumps({**pool_stats(), "ts": now}))
+    except Exception as e:
+        logger.debug(f"Could not publish pool stats: {e}")
+
+@worker_ready.connect
+def trigger_seen_urls_warm_load(sender=None, **kwargs):
+    r = redis.from_url(os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0"))
+    if r.set(seen_urls.SEEN_URLS_WARMING_KEY, "1", nx=True, ex=300):
+        celery_app.send_task("ai.warm_seen_urls", queue="ai_queue")
+
+@celery_app.task(name="ai.warm_seen_urls")
+def warm_seen_urls_task():
+    db = SessionLocal()
+    r = redis.from_url(os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0"))
+    try:
+        count = seen_urls.warm_load(r, db, JobEntry)
+        logger.info(f"🔥 Seen-set warm-loaded with {count} job URLs.")
+    except Exception as e:
+        logger.error(f"Warm-load of seen-set failed: {e}", exc_info=True)
+        r.delete(seen_urls.SEEN_URLS_WARMING_KEY)
+    finally:
+        db.close()
+
+FILTER_CHUNK_SIZE = int(os.getenv("FILTER_CHUNK_SIZE", "80"))
+FILTER_MAX_PARALLEL = int(os.getenv("FILTER_MAX_PARALLEL", "4"))
+
+def filter_urls_with_llm(base_url, urls_chunk):
+    system_prompt = """
+    Du bist ein Crawler-Filter. Analysiere den gesamten Text und gib ein JSON Array mit ALLEN relevanten Job-Detail-URLs zurück. Gib NUR das Array zurück.
+    Beispiel-Output: ["https://firma.de/jobs/entwickler-123", "https://firma.de/career/marketing-manager"]
+    """
+    return cached_completion(
+        "filter_urls",
+        model="tngtech/deepseek-r1t2-chimera:free",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Basis: {base_url}. Liste: {json.dumps(urls_chunk)}"}
+        ],
+        parse=parse_json_response,
+        temperature=0.0
+    )
 
 @celery_app.task(name="ai.filter_urls")
-def filter_urls_task(args):
+def filter_urls_task(args, run_id=None):
     if not args: 
         logger.warning("filter_urls_task called with empty args")
         return []
         
     base_url, urls_list = args
+    urls_list = list(dict.fromkeys(urls_list))
     logger.info(f"Filtering url with Input list size: {len(urls_list)}")
     
+    r = redis.from_url(REDIS_URL, decode_responses=True)
+    domain = urlparse(base_url).netloc
+    stats = dict.fromkeys(["rule_accept", "rule_reject", "learned_accept", "learned_reject", "llm_accept", "llm_reject", "llm_chunks", "llm_errors"], 0)
+
     try:
-        system_prompt = """
-        Du bist ein Crawler-Filter. Analysiere den gesamten Text und gib ein JSON Array mit ALLEN relevanten Job-Detail-URLs zurück. Gib NUR das Array zurück.
-        Beispiel-Output: ["https://firma.de/jobs/entwickler-123", "https://firma.de/career/marketing-manager"]
-        """
-        response = client.chat.completions.create(
-            model="tngtech/deepseek-r1t2-chimera:free",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Basis: {base_url}. Liste: {json.dumps(urls_list)}"}
-            ],
-            temperature=0.0
-        )
-        content = response.choices[0].message.content.strip().replace("```json", "").replace("```", "")
-        result_urls = json.loads(content)
-        logger.info(f"Filter result: {len(result_urls)} relevant URLs found.")
-        return result_urls
+        learned = url_classifier.load_learned(r, domain)
     except Exception as e:
-        logger.error(f"Filter Error processing {base_url}: {e}", exc_info=True)
-        return []
+        logger.warning(f"Could not load learned URL patterns for {domain}: {e}")
+        learned = {}
+
+    accepted = set()
+    ambiguous = []
+    for url in urls_list:
+        decision = url_classifier.classify_by_rules(url, base_url)
+        source = "rule"
+        if decision is None:
+            decision = url_classifier.classify_by_learned(url, learned)
+            source = "learned"
+        if decision is None:
+            ambiguous.append(url)
+            continue
+        stats[f"{source}_{decision}"] += 1
+        if decision == url_classifier.ACCEPT:
+            accepted.add(url)
+
+    chunks = [sorted(ambiguous[i:i + FILTER_CHUNK_SIZE]) for i in range(0, len(ambiguous), FILTER_CHUNK_SIZE)]
+    llm_decisions = {}
+    if chunks:
+        logger.info(f"Sending {len(ambiguous)} ambiguous URLs to the LLM in {len(chunks)} chunks.")
+        with ThreadPoolExecutor(max_workers=FILTER_MAX_PARALLEL) as executor:
+            futures = {executor.submit(filter_urls_with_llm, base_url, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                stats["llm_chunks"] += 1
+                try:
+                    result = future.result()
+                    relevant = set(result) if isinstance(result, list) else set()
+                except Exception as e:
+                    logger.error(f"Filter Error processing chunk of {base_url}: {e}", exc_info=True)
+                    stats["llm_errors"] += 1
+                    continue
+                for url in chunk:
+                    decision = url_classifier.ACCEPT if url in relevant else url_classifier.REJECT
+                    llm_decisions[url] = decision
+                    stats[f"llm_{decision}"] += 1
+                    if decision == url_classifier.ACCEPT:
+                        accepted.add(url)
+
+    try:
+        url_classifier.learn(r, domain, llm_decisions)
+        url_classifier.record_stats(r, stats)
+    except Exception as e:
+        logger.warning(f"Could not store URL classifier state: {e}")
+
+    if stats["llm_errors"] and run_id:
+        # Listing nicht als verarbeitet übernehmen (schedule_crawls findet nichts zum Committen),
+        # damit der nächste Crawl die URLs der fehlgeschlagenen Chunks erneut klassifiziert
+        logger.warning(f"{stats['llm_errors']} LLM chunks failed for {base_url}, listing will be rechecked next crawl.")
+        crawl_runs.pop_stash(r, run_id, f"listing:{base_url}")
+
+    result_urls = [url for url in urls_list if url in accepted]
+    logger.info(f"Filter result: {len(result_urls)} relevant URLs found. Stages: {stats}")
+    crawl_runs.update(r, run_id, relevant=len(result_urls))
+    return result_urls
+
+ANALYZE_BATCH_SIZE = int(os.getenv("ANALYZE_BATCH_SIZE", "8"))
+ANALYZE_BATCH_WINDOW = float(os.getenv("ANALYZE_BATCH_WINDOW", "3"))
+
+# Claim muss einen einzelnen LLM-Call samt Retries überdauern; zwischen den Calls verlängert
+# analyze_batch_task den Claim per touch(), sonst würde recover_stale einen laufenden Batch doppelt vergeben
+ANALYZE_CLAIM_TIMEOUT = int((llm_gateway.LLM_MAX_RETRIES + 1) * (llm_gateway.LLM_TIMEOUT + llm_gateway.LLM_BACKOFF_MAX))
+
+def get_analyze_queue(r):
+    return RedisBatchQueue(
+        r, "analyze", celery_app, "ai.analyze_batch",
+        max_items=ANALYZE_BATCH_SIZE, window_seconds=ANALYZE_BATCH_WINDOW,
+        processing_timeout=ANALYZE_CLAIM_TIMEOUT
+    )
+
+JOB_SINK_BATCH_SIZE = int(os.getenv("JOB_SINK_BATCH_SIZE", "50"))
+JOB_SINK_WINDOW = float(os.getenv("JOB_SINK_WINDOW", "1"))
+
+def get_job_sink(r):
+    return RedisBatchQueue(
+        r, "jobsink", celery_app, "ai.flush_jobs",
+        max_items=JOB_SINK_BATCH_SIZE, window_seconds=JOB_SINK_WINDOW
+    )
+
+def find_jobs_to_analyze(db, r, jobs):
+    """Return [(job_data, existing_entry_or_None)] for jobs that are new or whose content changed."""
+    existing_by_id = {
+        job.id: job for job in db.query(JobEntry).filter(JobEntry.id.in_([j['id'] for j in jobs])).all()
+    }
+    todo = []
+    for job_data in jobs:
+        content_hash = job_data.get('content_hash')
+        existing = existing_by_id.get(job_data['id'])
+        if existing:
+            if not content_hash or existing.content_hash in (None, content_hash):
+                if content_hash and existing.content_hash is None:
+                    # Altbestand: Hash nachtragen statt neu zu analysieren
+                    existing.content_hash = content_hash
+                    db.commit()
+                logger.info(f"Job {job_data['id']} already exists in database and is unchanged. Skipping analysis.")
+                seen_urls.mark_seen(r, job_data.get('url'))
+                crawl_runs.record(r, job_data.get('run_id'), "skipped", [job_data.get('url')])
+                continue
+            logger.info(f"Content of Job {job_data['id']} changed. Re-analyzing.")
+        todo.append((job_data, existing))
+    return todo
+
+def analyze_single(job_data, profile_str):
+    logger.info(f"Sending analysis request to LLM for Job {job_data['id']}...")
+    data = cached_completion(
+        "analyze_job",
+        model="tngtech/deepseek-r1t2-chimera:free", 
+        messages=[
+            {"role": "system", "content": "Antworte NUR JSON: { 'score': 0-100, 'reason_de': '...' }"}, 
+            {"role": "user", "content": f"Job: {job_data['title']} \n {job_data['description'][:3000]} \n User: {profile_str}"}
+        ],
+        parse=parse_json_response,
+        temperature=0.0
+    )
+    logger.info(f"LLM analysis completed for Job {job_data['id']}. Score: {data.get('score')}")
+    return data
+
+def parse_batch_response(content):
+    results = parse_json_response(content)
+    if not isinstance(results, list):
+        raise ValueError("Batch response is not a JSON array")
+    return {str(item["id"]): item for item in results if isinstance(item, dict) and "id" in item}
+
+def analyze_many(jobs, profile_str):
+    """Score several jobs in one LLM request; returns {job_id: {score, reason_de}} for parsed results."""
+    system_prompt = """
+    Du bewertest mehrere Stellenanzeigen für denselben Bewerber.
+    Antworte NUR mit einem JSON Array, ein Objekt pro Stelle:
+    [{ "id": "<id der Stelle>", "score": 0-100, "reason_de": "..." }]
+    """
+    jobs_text = "\n\n".join(
+        f"### id: {job['id']}\nJob: {job['title']}\n{job['description'][:3000]}" for job in jobs
+    )
+    logger.info(f"Sending batch analysis request to LLM for {len(jobs)} jobs...")
+    results = cached_completion(
+        "analyze_batch",
+        model="tngtech/deepseek-r1t2-chimera:free",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"User: {profile_str}\n\nSTELLEN:\n{jobs_text}"}
+        ],
+        parse=parse_batch_response,
+        temperature=0.0
+    )
+    return {job_id: data for job_id, data in results.items() if "score" in data}
+
+def store_analysis(r, job_data, data):
+    # Write-Behind: Zeile landet im Sink und wird gebündelt per Upsert geschrieben.
+    # run_id reist mit und wird erst beim Flush gezählt, wenn die Zeile wirklich in der DB ist
+    pending = get_job_sink(r).push({**job_row(job_data, data), "run_id": job_data.get('run_id')})
+    logger.info(f"Job {job_data['id']} queued for storage ({pending} pending).")
+
+def prescore_locally(profile, todo):
+    """Split jobs into (llm_todo, local_results) using the local relevance score."""
+    if not profile:
+        return todo, []
+    profile_vector = profile.vector
+    scores = score_jobs(profile_vector, [job_data for job_data, _ in todo])
+
+    llm_todo, local_results = [], []
+    for (job_data, existing), (score, matched) in zip(todo, scores):
+        job_data['local_score'] = score
+        # Schwelle 0: nur mitschreiben, damit /analysis/calibration Daten bekommt
+        if LOCAL_SCORE_THRESHOLD <= 0 or score >= LOCAL_SCORE_THRESHOLD or random.random() < LOCAL_SCORE_AUDIT_RATE:
+            llm_todo.append((job_data, existing))
+        else:
+            data = {"score": score, "reason_de": local_reason(score, matched, profile_vector), "score_source": "local"}
+            local_results.append((job_data, existing, data))
+    if local_results:
+        logger.info(f"⏭️ {len(local_results)} of {len(todo)} jobs below local threshold {LOCAL_SCORE_THRESHOLD}, skipping LLM.")
+    return llm_todo, local_results
+
+def analyze_and_store(db, r, jobs, heartbeat=None):
+    heartbeat = heartbeat or (lambda: None)
+    todo = find_jobs_to_analyze(db, r, jobs)
+    if not todo:
+        return
+    profile = profile_cache.get_profile(r)
+    if profile:
+        profile_str = profile.prompt
+    else:
+        logger.warning("No user profile found (ID 1). Using default fallback profile.")
+        profile_str = "Python Dev"
+
+    todo, local_results = prescore_locally(profile, todo)
+    for job_data, existing, data in local_results:
+        try:
+            store_analysis(r, job_data, data)
+        except Exception as e:
+            logger.error(f"Analyze Error for Job {job_data.get('id')}: {e}", exc_info=True)
+            page_cache.invalidate(r, job_data.get('url'))
+            crawl_runs.record(r, job_data.get('run_id'), "failed", [job_data.get('url')])
+
+    results = {}
+    if len(todo) > 1:
+        try:
+            heartbeat()
+            results = analyze_many([job_data for job_data, _ in todo], profile_str)
+        except Exception as e:
+            logger.warning(f"Batch analysis failed, falling back to single-job calls: {e}")
+        missing = len(todo) - len(results)
+        if missing:
+            logger.info(f"{missing} of {len(todo)} jobs not resolved by the batch response, analyzing individually.")
+
+    for job_data, existing in todo:
+        try:
+            if job_data['id'] not in results:
+                heartbeat()
+            data = results.get(job_data['id']) or analyze_single(job_data, profile_str)
+            store_analysis(r, job_data, data)
+        except Exception as e:
+            logger.error(f"Analyze Error for Job {job_data.get('id')}: {e}", exc_info=True)
+            page_cache.invalidate(r, job_data.get('url'))
+            crawl_runs.record(r, job_data.get('run_id'), "failed", [job_data.get('url')])
 
 @celery_app.task(name="ai.analyze_job")
 def analyze_job_task(job_data):
@@ -76,74 +346,128 @@ def analyze_job_task(job_data):
     job_title = job_data.get('title', 'unknown')
     logger.info(f"[TASK] Starting Job Analysis for ID: {job_id}, Title: {job_title}")
     
+    r = redis.from_url(REDIS_URL)
+
+    if ANALYZE_BATCH_SIZE > 1:
+        pending = get_analyze_queue(r).push(job_data)
+        logger.info(f"Job {job_id} queued for batch analysis ({pending} pending).")
+        return
+
     db = SessionLocal()
-    r = redis.from_url(os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0"))
-    
     try:
-        if db.query(JobEntry).filter(JobEntry.id == job_data['id']).first():
-            logger.info(f"Job {job_id} already exists in database. Skipping analysis.")
-            return
-        
-        profile = db.query(UserProfile).filter(UserProfile.id == 1).first()
-        if profile:
-            cv_text = format_cv_for_prompt(profile.cv_data)
-            profile_str = f"Rolle: {profile.role}, Skills: {profile.skills}\nDetails:\n{cv_text}"
-        else:
-            logger.warning("No user profile found (ID 1). Using default fallback profile.")
-            profile_str = "Python Dev"
+        analyze_and_store(db, r, [job_data])
+    finally:
+        db.close()
 
-        logger.info(f"Sending analysis request to LLM for Job {job_id}...")
-        response = client.chat.completions.create(
-            model="tngtech/deepseek-r1t2-chimera:free", 
-            messages=[
-                {"role": "system", "content": "Antworte NUR JSON: { 'score': 0-100, 'reason_de': '...' }"}, 
-                {"role": "user", "content": f"Job: {job_data['title']} \n {job_data['description'][:3000]} \n User: {profile_str}"}
-            ],
-            temperature=0.0
-        )
-        content = response.choices[0].message.content.strip().replace("```json", "").replace("```", "")
-        data = json.loads(content)
-        logger.info(f"LLM analysis completed for Job {job_id}. Score: {data.get('score')}")
-        
-        db_job = JobEntry(
-            id=job_data['id'], 
-            title=job_data['title'], 
-            company=job_data['company'], 
-            description=job_data['description'], 
-            match_score=float(data.get("score", 0)), 
-            url=job_data.get('url'),
-            reasoning=data.get("reason_de", ""),
-            application_draft=None,
-            status="OPEN"
-        )
-        
-        db.add(db_job)
-        db.commit()
-        logger.info(f"Job {job_id} saved to database.")
-
-        payload = json.dumps({
-            "type": "new_job",
-            "job": {
-                "id": db_job.id,
-                "title": db_job.title,
-                "company": db_job.company,
-                "description": db_job.description,
-                "match_score": db_job.match_score,
-                "reasoning": db_job.reasoning,
-                "url": db_job.url,
-                "status": "OPEN",
-                "created_at": db_job.created_at.isoformat() if db_job.created_at else None
-            }
-        })
-        
-        r.publish("job_updates", payload)
-        logger.info(f"✅ WebSocket Event 'new_job' published for {db_job.title}")
+@celery_app.task(name="ai.analyze_batch")
+def analyze_batch_task():
+    r = redis.from_url(REDIS_URL)
+    queue = get_analyze_queue(r)
+    queue.recover_stale()
+    batch_id, jobs = queue.claim()
+    if not jobs:
+        queue.finish_flush()
+        return
 
+    logger.info(f"[TASK] Starting batch analysis of {len(jobs)} jobs (batch {batch_id})")
+    db = SessionLocal()
+    try:
+        analyze_and_store(db, r, jobs, heartbeat=lambda: queue.touch(batch_id))
+        queue.ack(batch_id)
     except Exception as e:
-        logger.error(f"Analyze Error for Job {job_id}: {e}", exc_info=True)
+        logger.error(f"Batch analysis {batch_id} failed: {e}", exc_info=True)
         db.rollback()
+        queue.requeue(batch_id)
     finally:
         db.close()
+        queue.finish_flush()
+
+def record_flushed_runs(r, rows, run_ids, failed_ids):
+    # Erst hier zählt ein Job als analysiert: pro Lauf und Ergebnis ein Latch-Schritt.
+    # Wiederholte Batches zählen nicht doppelt, der Latch nimmt jede URL nur einmal
+    outcomes = {}
+    for row, run_id in zip(rows, run_ids):
+        if run_id:
+            key = (run_id, "failed" if row["id"] in failed_ids else "analyzed")
+            outcomes.setdefault(key, []).append(row["url"])
+    for (run_id, outcome), urls in outcomes.items():
+        crawl_runs.record(r, run_id, outcome, urls)
+
+@celery_app.task(name="ai.flush_jobs")
+def flush_jobs_task():
+    r = redis.from_url(REDIS_URL)
+    sink = get_job_sink(r)
+    sink.recover_stale()
+    batch_id, rows = sink.claim()
+    if not rows:
+        sink.finish_flush()
+        return
+
+    run_ids = [row.pop("run_id", None) for row in rows]
+    db = SessionLocal()
+    try:
+        # Idempotenter Upsert: nach einem Absturz vor dem ack wird der Batch einfach erneut geschrieben
+        stored, failed = upsert_jobs(db, rows)
+        sink.ack(batch_id)
+        logger.info(f"💾 Flushed {len(stored)} jobs to database (batch {batch_id}).")
+        for row in failed:
+            page_cache.invalidate(r, row.get('url'))
+        record_flushed_runs(r, rows, run_ids, {row["id"] for row in failed})
+        publish_stored(r, stored)
+    except Exception as e:
+        logger.error(f"Job sink flush {batch_id} failed: {e}", exc_info=True)
+        db.rollback()
+        sink.requeue(batch_id)
+    finally:
+        db.close()
+        sink.finish_flush()
+
+@celery_app.task(name="ai.recover_batches")
+def recover_batches_task():
+    # Per Beat: verwaiste Claims zurücklegen und liegengebliebene Einträge flushen, auch wenn
+    # gerade kein Flush-Task läuft, der recover_stale selbst aufrufen würde
+    r = redis.from_url(REDIS_URL)
+    for queue in (get_analyze_queue(r), get_job_sink(r)):
+        recovered = queue.recover()
+        if recovered:
+            logger.warning(f"Recovered {recovered} stale batches of {queue.name}.")
+
+@celery_app.task(name="ai.prune_llm_cache")
+def prune_llm_cache_task():
+    # Ausgelagerte Einträge laufen sonst nie ab, _load_spilled filtert sie nur
+    removed = llm_cache.prune_spilled()
+    if removed:
+        logger.info(f"🧹 Pruned {removed} expired LLM cache rows from Postgres.")
+
+# Streaming: Chunks werden gesammelt und alle N Tokens oder M Millisekunden veröffentlicht
+STREAM_CHUNK_TOKENS = int(os.getenv("STREAM_CHUNK_TOKENS", "16"))
+STREAM_CHUNK_MS = float(os.getenv("STREAM_CHUNK_MS", "150"))
+
+class ChunkPublisher:
+    def __init__(self, r, job_id):
+        self.r = r
+        self.job_id = job_id
+        self.seq = 0
+        self.buffer = []
+        self.last_flush = time.time()
+
+    def __call__(self, delta):
+        self.buffer.append(delta)
+        if len(self.buffer) >= STREAM_CHUNK_TOKENS or (time.time() - self.last_flush) * 1000 >= STREAM_CHUNK_MS:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        events.publish(self.r, {
+            "type": "application_chunk",
+            "job_id": self.job_id,
+            "seq": self.seq,
+            "delta": "".join(self.buffer)
+        })
+        self.seq += 1
+        self.buffer = []
+        self.last_flush = time.time()
 
 @celery_app.task(name="ai.generate_application")
 def generate_application_task(job_id):
@@ -157,22 +481,22 @@ def generate_application_task(job_id):
             logger.error(f"FEHLER: Job ID {job_id} nicht in DB gefunden!")
             return
 
-        profile = db.query(UserProfile).filter(UserProfile.id == 1).first()
+        profile = profile_cache.get_profile(r)
         if not profile:
             error_msg = "Profil unvollständig. Bitte in den Einstellungen Lebenslauf hinterlegen."
             logger.error(f"Application generation failed: {error_msg}")
             
-            r.publish("job_updates", json.dumps({
+            events.publish(r, {
                 "type": "global_error",
                 "message": error_msg
-            }))
+            })
             
-            r.publish("job_updates", json.dumps({"type": "crawl_completed"}))
+            events.publish(r, {"type": "crawl_completed"})
             return
         
         logger.info(f"Daten geladen. Job: {job.title}, User: {profile.role}")
 
-        cv_text = format_cv_for_prompt(profile.cv_data)
+        cv_text = profile.cv_text
         
         system_prompt = """
         Du bist ein professioneller Karriere-Coach. Schreibe ein überzeugendes Anschreiben.
@@ -187,30 +511,94 @@ def generate_application_task(job_id):
         {cv_text}
         """
 
-        logger.info("⏳ Sende Anfrage an OpenAI für Anschreiben...")
-        response = client.chat.completions.create(
+        logger.info("⏳ Sende Streaming-Anfrage an OpenAI für Anschreiben...")
+        # Kreative Antwort (temperature 0.7): nicht gecacht, Tokens gehen direkt an die Abonnenten des Jobs
+        publisher = ChunkPublisher(r, job.id)
+        draft = llm_gateway.stream_chat_sync(
+            "generate_application",
             model="tngtech/deepseek-r1t2-chimera:free", 
             messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+            on_delta=publisher,
             temperature=0.7
         )
-        logger.info("Antwort von OpenAI erhalten (Anschreiben).")
+        publisher.flush()
+        logger.info(f"Antwort von OpenAI erhalten (Anschreiben, {publisher.seq} Chunks).")
         
-        job.application_draft = response.choices[0].message.content
+        # Erst am Ende einmal persistieren
+        job.application_draft = draft
+        job.generation_error = None
         db.commit()
         logger.info(f"Anschreiben für Job {job_id} in DB gespeichert.")
         
         # Redis connection refresh often not needed if 'r' is valid, but kept from original structure or re-init if preferred. 
         # Variable 'r' is already initialized above.
-        r.publish("job_updates", json.dumps({
+        events.publish(r, {
             "type": "job_update",
             "job_id": job.id,
             "status": "COMPLETED",
-            "application_draft": job.application_draft
-        }))
+            # Nur ein Flag statt des ganzen Textes: der Client lädt den Entwurf über GET /jobs/{id}
+            "has_application": True
+        })
         logger.info(f"✅ WebSocket Event 'job_update' für {job.id} gesendet.")
+
+        # PDF gleich vorrendern, damit der Download direkt aus dem Cache kommt
+        celery_app.send_task("ai.render_application_pdf", args=[job.id], queue="ai_queue")
         
     except Exception as e:
         logger.error(f"CRASH BEI GENERIERUNG für Job {job_id}: {e}", exc_info=True)
         db.rollback()
+        # Abonnenten nicht mit einem halben Stream hängen lassen
+        events.publish(r, {
+            "type": "job_update",
+            "job_id": job_id,
+            "generation_error": "Anschreiben konnte nicht generiert werden."
+        })
+    finally:
+        db.close()
+
+@celery_app.task(name="ai.render_application_pdf")
+def render_application_pdf_task(job_id):
+    db = SessionLocal()
+    r = redis.from_url(REDIS_URL)
+    try:
+        job = db.query(JobEntry).filter(JobEntry.id == job_id).first()
+        if not job or not job.application_draft:
+            return
+        profile = profile_cache.get_profile(r)
+        location = profile.location if profile else None
+        today = pdf_renderer.today_str()
+        key = pdf_renderer.cache_key(job.application_draft, job.company, location, today)
+        if r.exists(key):
+            return
+        start_time = time.time()
+        pdf_renderer.store(r, key, pdf_renderer.render_pdf(job.application_draft, job.company, location, today))
+        logger.info(f"📄 PDF für Job {job_id} vorgerendert in {time.time() - start_time:.2f}s.")
+    except Exception as e:
+        logger.error(f"PDF-Vorrendern für Job {job_id} fehlgeschlagen: {e}", exc_info=True)
+    finally:
+        db.close()
+
+@celery_app.task(name="ai.ingest_cv")
+def ingest_cv_task(ingest_id, content_hash):
+    logger.info(f"[TASK] CV-Import {ingest_id} gestartet.")
+    r = redis.from_url(REDIS_URL)
+    progress = cv_ingest.Progress(r, ingest_id)
+    db = SessionLocal()
+    try:
+        progress("started", 5)
+        parsed_data = cv_ingest.parse_upload(r, ingest_id, content_hash, progress)
+        progress("saving", 80)
+        profile = cv_ingest.apply_to_profile(db, parsed_data)
+        profile_cache.publish(r, profile)
+        progress("done", 100, data=parsed_data)
+        logger.info(f"✅ CV-Import {ingest_id} abgeschlossen.")
+    except cv_ingest.IngestFailed as e:
+        logger.warning(f"CV-Import {ingest_id} fehlgeschlagen: {e}")
+        progress("failed", 100, error=str(e))
+    except Exception as e:
+        logger.error(f"CV-Import {ingest_id} abgestürzt: {e}", exc_info=True)
+        db.rollback()
+        progress("failed", 100, error="Datenbank Fehler")
     finally:
+        r.delete(cv_ingest.upload_key(ingest_id))
         db.close()
@@ -0,0 +1,188 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Dict, Set
+
+from fastapi import WebSocket
+
+from events import EVENT_SCHEMA_VERSION
+
+logger = logging.getLogger(__name__)
+
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "256"))
+# drop_oldest: bei voller Queue ältestes Broadcast-Event verwerfen (Client holt sich den Stand per /jobs/changes);
+# job-bezogene Stream-Frames (Anschreiben) werden nie verworfen, dann wird der Client getrennt
+# disconnect: langsamen Client trennen, er verbindet sich neu und lädt frisch
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest")
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+# Events, die nur an die Abonnenten eines Jobs gehen statt an alle Clients
+JOB_SCOPED_EVENTS = {"application_chunk"}
+
+# new_job-Bursts während eines Crawls werden zu einem jobs_batch-Frame pro Intervall zusammengefasst
+WS_BATCH_INTERVAL_MS = int(os.getenv("WS_BATCH_INTERVAL_MS", "250"))
+WS_BATCH_MAX = int(os.getenv("WS_BATCH_MAX", "200"))
+
+
+class ClientConnection:
+    """One socket with its own bounded outbound queue, drained by a dedicated writer task."""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+        self.subscriptions: Set[str] = set()
+        self.dropped = 0
+        self.writer = None
+
+    def enqueue(self, message: str, droppable: bool = True) -> bool:
+        """Queue a message; returns False if the client is too slow and must be disconnected."""
+        try:
+            self.queue.put_nowait((message, droppable))
+            return True
+        except asyncio.QueueFull:
+            if WS_SLOW_CLIENT_POLICY == "disconnect":
+                return False
+            # Ein verlorener Chunk würde das Anschreiben unbemerkt zerreißen: lieber neu verbinden lassen
+            _, oldest_droppable = self.queue.get_nowait()
+            if not oldest_droppable:
+                return False
+            self.queue.put_nowait((message, droppable))
+            self.dropped += 1
+            return True
+
+
+class WebSocketManager:
+    def __init__(self):
+        self.connections: Set[ClientConnection] = set()
+        self.job_subscribers: Dict[str, Set[ClientConnection]] = {}
+        self.dropped_messages = 0
+        self.slow_disconnects = 0
+        self.sent_messages = 0
+        self.pending_jobs: Dict[str, dict] = {}
+        self.batch_timer = None
+        self.batched_jobs = 0
+        self.batches_sent = 0
+
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
+        await websocket.accept()
+        client = ClientConnection(websocket)
+        self.connections.add(client)
+        client.writer = asyncio.create_task(self._write_loop(client))
+        return client
+
+    def disconnect(self, client: ClientConnection):
+        if client not in self.connections:
+            return
+        self.connections.discard(client)
+        for job_id in client.subscriptions:
+            self._remove_subscriber(client, job_id)
+        client.subscriptions.clear()
+        self.dropped_messages += client.dropped
+        if client.writer and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    async def _write_loop(self, client: ClientConnection):
+        try:
+            while True:
+                message, _ = await client.queue.get()
+                await asyncio.wait_for(client.websocket.send_text(message), WS_SEND_TIMEOUT)
+                self.sent_messages += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # Nach Timeout kann ein Frame halb geschrieben sein: Socket schließen, damit der Browser neu verbindet
+            logger.info(f"WebSocket writer stopped ({type(e).__name__}), closing client.")
+            await self._close(client, slow=isinstance(e, asyncio.TimeoutError))
+
+    async def _close_slow(self, client: ClientConnection):
+        await self._close(client, slow=True)
+
+    async def _close(self, client: ClientConnection, slow: bool):
+        if slow:
+            self.slow_disconnects += 1
+        self.disconnect(client)
+        try:
+            # 1013 = Try Again Later; ein hängender Socket darf auch das Schließen nicht blockieren
+            await asyncio.wait_for(client.websocket.close(code=1013), WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def subscribe(self, client: ClientConnection, job_id: str):
+        client.subscriptions.add(job_id)
+        self.job_subscribers.setdefault(job_id, set()).add(client)
+
+    def unsubscribe(self, client: ClientConnection, job_id: str):
+        client.subscriptions.discard(job_id)
+        self._remove_subscriber(client, job_id)
+
+    def _remove_subscriber(self, client: ClientConnection, job_id: str):
+        subscribers = self.job_subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(client)
+            if not subscribers:
+                del self.job_subscribers[job_id]
+
+    def _fan_out(self, clients, message: str, droppable: bool = True):
+        # Nur einreihen, nie auf einen Client warten: das Senden übernimmt der Writer-Task
+        for client in clients:
+            if not client.enqueue(message, droppable):
+                asyncio.create_task(self._close_slow(client))
+
+    def broadcast(self, message: str):
+        self._fan_out(list(self.connections), message)
+
+    def send_to_job(self, job_id: str, message: str):
+        self._fan_out(list(self.job_subscribers.get(job_id, ())), message, droppable=False)
+
+    def _queue_new_job(self, job: dict):
+        # Gleiche id im selben Fenster: letzter Stand gewinnt
+        self.pending_jobs.pop(job["id"], None)
+        self.pending_jobs[job["id"]] = job
+        self.batched_jobs += 1
+        if len(self.pending_jobs) >= WS_BATCH_MAX:
+            self.flush_batch()
+        elif self.batch_timer is None:
+            self.batch_timer = asyncio.get_running_loop().call_later(WS_BATCH_INTERVAL_MS / 1000, self.flush_batch)
+
+    def flush_batch(self):
+        if self.batch_timer is not None:
+            self.batch_timer.cancel()
+            self.batch_timer = None
+        if not self.pending_jobs:
+            return
+        jobs = list(self.pending_jobs.values())
+        self.pending_jobs = {}
+        self.batches_sent += 1
+        self.broadcast(json.dumps({"v": EVENT_SCHEMA_VERSION, "type": "jobs_batch", "jobs": jobs}, separators=(",", ":")))
+
+    def dispatch(self, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            event = {}
+        event_type = event.get("type")
+        if event_type in JOB_SCOPED_EVENTS:
+            self.send_to_job(event.get("job_id"), payload)
+        elif event_type == "new_job" and event.get("job", {}).get("id"):
+            self._queue_new_job(event["job"])
+        else:
+            # Reihenfolge wahren: gepufferte Jobs vor späteren Updates ausliefern
+            self.flush_batch()
+            self.broadcast(payload)
+
+    def metrics(self):
+        depths = [client.queue.qsize() for client in self.connections]
+        return {
+            "connections": len(self.connections),
+            "job_subscriptions": sum(len(s) for s in self.job_subscribers.values()),
+            "queue_size": WS_QUEUE_SIZE,
+            "slow_client_policy": WS_SLOW_CLIENT_POLICY,
+            "queued_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "sent_messages": self.sent_messages,
+            "dropped_messages": self.dropped_messages + sum(client.dropped for client in self.connections),
+            "slow_disconnects": self.slow_disconnects,
+            "batched_jobs": self.batched_jobs,
+            "batches_sent": self.batches_sent,
+        }
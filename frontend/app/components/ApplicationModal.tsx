@@ -5,10 +5,11 @@ interface Props {
   onClose: () => void;
   content: string;
   jobId: string; // NEU: Wir brauchen die JobID für den Download Link
+  isStreaming?: boolean; // Anschreiben wird gerade live generiert
 }
 
 // Update Props oben
-export default function ApplicationModal({ isOpen, onClose, content, jobId }: Props) {
+export default function ApplicationModal({ isOpen, onClose, content, jobId, isStreaming = false }: Props) {
   if (!isOpen) return null;
 
   const handleCopy = () => {
@@ -43,14 +44,23 @@ export default function ApplicationModal({ isOpen, onClose, content, jobId }: Pr
         
         {/* Header */}
         <div className="p-4 border-b border-slate-100 flex justify-between items-center bg-slate-50 rounded-t-xl">
-          <h3 className="font-bold text-lg text-slate-800">📝 Anschreiben Vorschau</h3>
+          <h3 className="font-bold text-lg text-slate-800 flex items-center gap-2">
+            📝 Anschreiben Vorschau
+            {isStreaming && (
+              <span className="text-xs font-medium text-indigo-600 bg-indigo-50 px-2 py-0.5 rounded animate-pulse">wird geschrieben...</span>
+            )}
+          </h3>
           <button onClick={onClose} className="text-slate-400 hover:text-slate-600 text-2xl leading-none cursor-pointer">&times;</button>
         </div>
 
         {/* Content */}
         <div className="flex-1 overflow-y-auto p-12 bg-white">
             <div className="prose prose-slate max-w-none prose-p:text-slate-800 prose-headings:text-slate-900 font-serif">
-              <ReactMarkdown>{content}</ReactMarkdown>
+              {content ? (
+                <ReactMarkdown>{content}</ReactMarkdown>
+              ) : (
+                <p className="text-slate-400 animate-pulse">Warte auf die ersten Zeilen...</p>
+              )}
             </div>
         </div>
 
@@ -60,14 +70,15 @@ export default function ApplicationModal({ isOpen, onClose, content, jobId }: Pr
             Schließen
           </button>
           
-          <button onClick={handleCopy} className="px-4 py-2 bg-white border border-slate-300 text-slate-700 hover:bg-slate-50 rounded-lg font-medium cursor-pointer">
+          <button onClick={handleCopy} disabled={isStreaming} className="disabled:opacity-50 px-4 py-2 bg-white border border-slate-300 text-slate-700 hover:bg-slate-50 rounded-lg font-medium cursor-pointer">
             📋 Text kopieren
           </button>
 
           {/* NEU: PDF Button */}
           <button 
             onClick={handleDownload}
-            className="px-4 py-2 bg-indigo-600 text-white hover:bg-indigo-700 rounded-lg shadow-sm transition font-medium flex items-center gap-2 cursor-pointer"
+            disabled={isStreaming}
+            className="disabled:opacity-50 px-4 py-2 bg-indigo-600 text-white hover:bg-indigo-700 rounded-lg shadow-sm transition font-medium flex items-center gap-2 cursor-pointer"
           >
             📄 Als PDF speichern
           </button>
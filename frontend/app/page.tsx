@@ -1,6 +1,6 @@
 "use client";
 import Link from 'next/link';
-import { useEffect, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import ReactMarkdown from 'react-markdown';
 import ApplicationModal from './components/ApplicationModal';
 
@@ -9,70 +9,261 @@ interface Job {
   id: string;
   title: string;
   company: string;
-  description: string;
+  description?: string;
   match_score: number;
   reasoning: string;
   url?: string;
   application_draft?: string;
+  has_application?: boolean;
   created_at?: string;
   status?: string;
 }
 
+interface JobPage {
+  items: Job[];
+  next_cursor: string | null;
+  changes_cursor: string;
+}
+
+interface JobChanges {
+  items: Job[];
+  cursor: string;
+  has_more: boolean;
+  reset: boolean;
+}
+
+// Zähler eines Crawl-Laufs (crawl_progress / GET /crawls/{id})
+interface CrawlRun {
+  run_id: string;
+  scheduled: number;
+  analyzed: number;
+  skipped: number;
+  failed: number;
+  done: number;
+}
+
+const PAGE_SIZE = 50;
+// Muss zu EVENT_SCHEMA_VERSION in ai-service/events.py passen
+const EVENT_SCHEMA_VERSION = 1;
+
 export default function Home() {
   // --- STATE ---
   const [query, setQuery] = useState('');
   const [jobs, setJobs] = useState<Job[]>([]);
   const [expandedJobId, setExpandedJobId] = useState<string | null>(null);
   const [sortBy, setSortBy] = useState<'score' | 'date'>('score');
+  const sortRef = useRef<'score' | 'date'>('score');
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  // Delta-Sync: ETag der ersten Seite und Cursor für /jobs/changes
+  const etagRef = useRef<string | null>(null);
+  const changesCursorRef = useRef<string | null>(null);
 
   // Generator & Modal
   const [modalOpen, setModalOpen] = useState(false);
   const [modalContent, setModalContent] = useState('');
   const [modalJobId, setModalJobId] = useState('');
+  const [modalStreaming, setModalStreaming] = useState(false);
+  // Für den WebSocket-Handler: welcher Job gerade live im Modal gestreamt wird
+  const streamJobRef = useRef<string | null>(null);
+  const wsRef = useRef<WebSocket | null>(null);
 
   const [isCrawling, setIsCrawling] = useState(false);
+  const [crawlProgress, setCrawlProgress] = useState<CrawlRun | null>(null);
   const [pendingIds, setPendingIds] = useState<string[]>([]);
 
   const [globalError, setGlobalError] = useState<string | null>(null);
 
   // --- API ---
+  // Erste Seite laden (ersetzt die Liste); 304 = nichts geändert
   const fetchJobs = async () => {
     try {
-      const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/jobs`);
-      const data = await res.json();
-      setJobs(data);
+      const headers: Record<string, string> = {};
+      if (etagRef.current) headers['If-None-Match'] = etagRef.current;
+      const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/jobs?sort=${sortRef.current}&limit=${PAGE_SIZE}`, { headers, cache: 'no-store' });
+      if (res.status === 304) return;
+      const data: JobPage = await res.json();
+      etagRef.current = res.headers.get('ETag');
+      changesCursorRef.current = data.changes_cursor;
+      setJobs(data.items);
+      setNextCursor(data.next_cursor);
     } catch (e) { console.error("Fehler beim Laden:", e); }
   };
 
+  // Geänderte/neue Jobs per id in die geladene Liste übernehmen
+  const mergeJobs = (changed: Job[]) => {
+    if (changed.length === 0) return;
+    setJobs(prev => {
+      const byId = new Map(changed.map(job => [job.id, job]));
+      const merged = prev.map(job => (byId.has(job.id) ? { ...job, ...byId.get(job.id) } : job));
+      const known = new Set(prev.map(job => job.id));
+      return [...merged, ...changed.filter(job => !known.has(job.id))];
+    });
+  };
+
+  // Nur Änderungen seit dem letzten Stand holen statt die Liste neu zu laden
+  const syncChanges = async () => {
+    if (!changesCursorRef.current) return fetchJobs();
+    try {
+      let hasMore = true;
+      while (hasMore) {
+        const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/jobs/changes?since=${encodeURIComponent(changesCursorRef.current)}`, { cache: 'no-store' });
+        if (!res.ok) throw new Error(`changes ${res.status}`);
+        const data: JobChanges = await res.json();
+        if (data.reset) {
+          etagRef.current = null;
+          return fetchJobs();
+        }
+        changesCursorRef.current = data.cursor;
+        mergeJobs(data.items);
+        hasMore = data.has_more;
+      }
+    } catch (e) {
+      console.error("Fehler beim Abgleich:", e);
+      etagRef.current = null;
+      fetchJobs();
+    }
+  };
+
+  // Nächste Seite über den Cursor anhängen
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/jobs?sort=${sortRef.current}&limit=${PAGE_SIZE}&cursor=${encodeURIComponent(nextCursor)}`);
+      const data: JobPage = await res.json();
+      setJobs(prev => {
+        const known = new Set(prev.map(job => job.id));
+        return [...prev, ...data.items.filter(job => !known.has(job.id))];
+      });
+      setNextCursor(data.next_cursor);
+    } catch (e) {
+      console.error("Fehler beim Nachladen:", e);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // Beschreibung & Anschreiben nur bei Bedarf laden
+  const fetchJobDetail = async (jobId: string): Promise<Job | null> => {
+    try {
+      const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/jobs/${jobId}`);
+      if (!res.ok) return null;
+      const detail: Job = await res.json();
+      setJobs(prev => prev.map(job => (job.id === jobId ? { ...job, ...detail } : job)));
+      return detail;
+    } catch (e) {
+      console.error("Fehler beim Laden der Details:", e);
+      return null;
+    }
+  };
+
+  const changeSort = (sort: 'score' | 'date') => {
+    if (sort === sortRef.current) return;
+    sortRef.current = sort;
+    setSortBy(sort);
+    fetchJobs();
+  };
+
+  const toggleDetails = (job: Job) => {
+    if (expandedJobId === job.id) {
+      setExpandedJobId(null);
+      return;
+    }
+    setExpandedJobId(job.id);
+    if (job.description === undefined) fetchJobDetail(job.id);
+  };
+
   useEffect(() => {
     fetchJobs();
     fetch(`${process.env.NEXT_PUBLIC_API_URL}/status`)
       .then(res => res.json())
       .then(data => { if (data.crawling) setIsCrawling(true); });
 
-    const ws = new WebSocket(`${process.env.NEXT_PUBLIC_API_WS_URL}/ws`);
-    ws.onmessage = (event) => {
+    const handleMessage = (event: MessageEvent) => {
       const data = JSON.parse(event.data);
+      if (data.v !== EVENT_SCHEMA_VERSION) {
+        // Unbekanntes Event-Schema: nicht interpretieren, Stand über den Change-Feed holen
+        syncChanges();
+        return;
+      }
       if (data.type === "crawl_started") {
         setIsCrawling(true);
       }
+      else if (data.type === "crawl_progress") {
+        setIsCrawling(true);
+        setCrawlProgress(data.run);
+      }
       else if (data.type === "crawl_completed") {
-        setIsCrawling(false);
-        fetchJobs();
+        // Andere Läufe können noch aktiv sein
+        setIsCrawling(!!data.active_runs);
+        setCrawlProgress(null);
+        syncChanges();
+      }
+      else if (data.type === "jobs_batch" || data.type === "new_job") {
+        // Zusammenfassungen ohne Beschreibung; Details lädt toggleDetails bei Bedarf
+        const incoming: Job[] = data.type === "jobs_batch" ? data.jobs : [data.job];
+        const ids = new Set(incoming.map(job => job.id));
+        setJobs(prevJobs => [...[...incoming].reverse(), ...prevJobs.filter(job => !ids.has(job.id))]);
       }
-      else if (data.type === "new_job") {
-        setJobs(prevJobs => [data.job, ...prevJobs]);
+      else if (data.type === "application_chunk") {
+        if (data.job_id === streamJobRef.current) {
+          setModalContent(prev => prev + data.delta);
+        }
       }
       else if (data.type === "job_update") {
-        setJobs(prev => prev.map(job => (job.id === data.job_id ? { ...job, ...data } : job)));
+        const { type, v, job_id, ...changes } = data;
+        if (job_id === streamJobRef.current && (changes.has_application || changes.generation_error)) {
+          // Finaler Stand ersetzt die gestreamten Chunks; der Entwurf selbst kommt über GET /jobs/{id}
+          if (changes.has_application) {
+            fetchJobDetail(job_id).then(detail => {
+              // Inzwischen ein anderer Job im Modal? Dann nicht überschreiben
+              if (detail?.application_draft && (!streamJobRef.current || streamJobRef.current === job_id)) setModalContent(detail.application_draft);
+            });
+          }
+          else setModalContent(prev => prev || `⚠️ ${changes.generation_error}`);
+          setModalStreaming(false);
+          unsubscribeJob(job_id);
+        }
+        setJobs(prev => prev.map(job => (job.id === job_id ? { ...job, ...changes } : job)));
         setPendingIds(prev => prev.filter(id => id !== data.job_id));
       }
+      else if (data.type === "resync") {
+        // Server hat Events verpasst: Stand über den Change-Feed nachholen
+        syncChanges();
+      }
       else if (data.type === "global_error") {
         setGlobalError(data.message);
         setTimeout(() => setGlobalError(null), 8000);
       }
     };
-    return () => ws.close();
+
+    // Automatisch neu verbinden (Replika-Wechsel, Neustart, Trennung wegen Rückstau)
+    let stopped = false;
+    let retries = 0;
+    let retryTimer: ReturnType<typeof setTimeout> | undefined;
+    const connect = () => {
+      const ws = new WebSocket(`${process.env.NEXT_PUBLIC_API_WS_URL}/ws`);
+      wsRef.current = ws;
+      ws.onopen = () => {
+        retries = 0;
+        // Änderungen seit dem letzten Stand bzw. während der Trennung nachholen
+        if (changesCursorRef.current) syncChanges();
+        if (streamJobRef.current) ws.send(JSON.stringify({ action: 'subscribe', job_id: streamJobRef.current }));
+      };
+      ws.onmessage = handleMessage;
+      ws.onclose = () => {
+        if (stopped) return;
+        retryTimer = setTimeout(connect, Math.min(30000, 1000 * 2 ** retries++));
+      };
+    };
+    connect();
+
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      wsRef.current?.close();
+    };
   }, []);
 
   const startSearch = async () => {
@@ -88,19 +279,67 @@ export default function Home() {
     }
   };
 
+  // Alle in den Einstellungen hinterlegten Karriereseiten in einem Lauf scannen
+  const startBulkSearch = async () => {
+    setIsCrawling(true);
+    try {
+      const res = await fetch(`${process.env.NEXT_PUBLIC_API_SCRAPER_URL}/search/bulk`, {
+        method: 'POST', headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({})
+      });
+      const data = await res.json();
+      if (!res.ok || data.status !== 'Started') {
+        setIsCrawling(false);
+        setGlobalError(data.message || data.detail || 'Scan konnte nicht gestartet werden.');
+        setTimeout(() => setGlobalError(null), 8000);
+      }
+    } catch (e) {
+      setIsCrawling(false);
+    }
+  };
+
+  const sendWs = (message: object) => {
+    if (wsRef.current?.readyState === WebSocket.OPEN) wsRef.current.send(JSON.stringify(message));
+  };
+
+  const unsubscribeJob = (jobId: string) => {
+    sendWs({ action: 'unsubscribe', job_id: jobId });
+    if (streamJobRef.current === jobId) streamJobRef.current = null;
+  };
+
+  const closeModal = () => {
+    if (streamJobRef.current) unsubscribeJob(streamJobRef.current);
+    setModalStreaming(false);
+    setModalOpen(false);
+  };
+
   const handleGenerate = async (job: Job) => {
-    if (job.application_draft) {
-      setModalContent(job.application_draft);
-      setModalJobId(job.id);
-      setModalOpen(true);
-      return;
+    if (job.application_draft || job.has_application) {
+      const draft = job.application_draft ?? (await fetchJobDetail(job.id))?.application_draft;
+      if (draft) {
+        setModalContent(draft);
+        setModalJobId(job.id);
+        setModalOpen(true);
+        return;
+      }
     }
 
+    // Modal sofort öffnen und die Tokens live mitlesen
+    if (streamJobRef.current) unsubscribeJob(streamJobRef.current);
+    streamJobRef.current = job.id;
+    sendWs({ action: 'subscribe', job_id: job.id });
+    setModalContent('');
+    setModalJobId(job.id);
+    setModalStreaming(true);
+    setModalOpen(true);
+
     setPendingIds(prev => [...prev, job.id]);
     try {
       await fetch(`${process.env.NEXT_PUBLIC_API_URL}/jobs/${job.id}/generate`, { method: 'POST' });
     } catch (e) {
       setPendingIds(prev => prev.filter(id => id !== job.id));
+      unsubscribeJob(job.id);
+      setModalStreaming(false);
     }
   };
 
@@ -138,9 +377,10 @@ export default function Home() {
     <div className="min-h-screen bg-white text-gray-900 font-sans pb-20">
       <ApplicationModal
         isOpen={modalOpen}
-        onClose={() => setModalOpen(false)}
+        onClose={closeModal}
         content={modalContent}
         jobId={modalJobId}
+        isStreaming={modalStreaming}
       />
 
       {/* HEADER */}
@@ -170,19 +410,29 @@ export default function Home() {
                 {isCrawling && <span className="animate-spin h-4 w-4 border-2 border-white border-t-transparent rounded-full"></span>}
                 {isCrawling ? 'Scan läuft...' : 'Scan starten'}
               </button>
+              <button
+                onClick={startBulkSearch}
+                disabled={isCrawling}
+                title="Alle gespeicherten Job-URLs scannen"
+                className="border border-gray-200 hover:border-black text-gray-700 px-4 py-2 rounded-lg font-medium text-sm transition disabled:opacity-50 cursor-pointer whitespace-nowrap"
+              >
+                Alle Quellen
+              </button>
             </div>
           </div>
 
           <div className="flex justify-between items-center text-xs font-medium text-gray-400 mt-4 h-6">
             <div className="flex items-center gap-2">
-              <span>{jobs.length} Ergebnisse</span>
+              <span>{jobs.length}{nextCursor ? '+' : ''} Ergebnisse</span>
               {isCrawling && (
-                <span className="text-indigo-600 bg-indigo-50 px-2 py-0.5 rounded animate-pulse font-bold">📡 Crawler aktiv...</span>
+                <span className="text-indigo-600 bg-indigo-50 px-2 py-0.5 rounded animate-pulse font-bold">📡 Crawler aktiv{crawlProgress && crawlProgress.scheduled > 0
+                    ? ` (${crawlProgress.done}/${crawlProgress.scheduled})`
+                    : '...'}</span>
               )}
             </div>
             <div className="flex gap-4">
-              <button onClick={() => setSortBy('score')} className={`${sortBy === 'score' ? 'text-indigo-600 underline decoration-2 underline-offset-4' : 'hover:text-indigo-600'} transition cursor-pointer`}>Relevanz</button>
-              <button onClick={() => setSortBy('date')} className={`${sortBy === 'date' ? 'text-indigo-600 underline decoration-2 underline-offset-4' : 'hover:text-indigo-600'} transition cursor-pointer`}>Datum</button>
+              <button onClick={() => changeSort('score')} className={`${sortBy === 'score' ? 'text-indigo-600 underline decoration-2 underline-offset-4' : 'hover:text-indigo-600'} transition cursor-pointer`}>Relevanz</button>
+              <button onClick={() => changeSort('date')} className={`${sortBy === 'date' ? 'text-indigo-600 underline decoration-2 underline-offset-4' : 'hover:text-indigo-600'} transition cursor-pointer`}>Datum</button>
             </div>
           </div>
         </div>
@@ -269,7 +519,7 @@ export default function Home() {
                       disabled={isGenerating}
                       className={`
                         px-4 py-2 rounded-lg text-sm font-bold border flex items-center gap-2 transition shadow-sm cursor-pointer
-                        ${job.application_draft
+                        ${job.application_draft || job.has_application
                           ? 'bg-emerald-50 text-emerald-700 border-emerald-200 hover:bg-emerald-100'
                           : 'bg-white text-indigo-600 border-indigo-200 hover:bg-indigo-50 hover:border-indigo-300'}
                       `}
@@ -279,7 +529,7 @@ export default function Home() {
                           <span className="animate-spin h-4 w-4 border-2 border-current border-t-transparent rounded-full"></span>
                           Anschreiben wird generiert...
                         </>
-                      ) : job.application_draft ? (
+                      ) : job.application_draft || job.has_application ? (
                         '✅ Anschreiben ansehen'
                       ) : (
                         '✨ Anschreiben generieren'
@@ -288,7 +538,7 @@ export default function Home() {
 
                     {/* 3. DETAILS TOGGLE */}
                     <button
-                      onClick={() => setExpandedJobId(isExpanded ? null : job.id)}
+                      onClick={() => toggleDetails(job)}
                       className="
                             ml-auto px-4 py-2 
                             bg-slate-100 hover:bg-slate-200 
@@ -334,7 +584,11 @@ export default function Home() {
         prose-strong:text-gray-900
         prose-ul:list-disc prose-ul:pl-5
       ">
-                      <ReactMarkdown>{job.description}</ReactMarkdown>
+                      {job.description === undefined ? (
+                        <p className="text-sm text-gray-400 animate-pulse">Lade Beschreibung...</p>
+                      ) : (
+                        <ReactMarkdown>{job.description}</ReactMarkdown>
+                      )}
                     </article>
 
                     {/* Footer Hinweis */}
@@ -349,6 +603,18 @@ export default function Home() {
             </div>
           );
         })}
+
+        {nextCursor && (
+          <div className="flex justify-center pt-2">
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="px-5 py-2 bg-white border border-gray-200 hover:border-black text-gray-700 rounded-lg text-sm font-medium transition disabled:opacity-50 cursor-pointer"
+            >
+              {loadingMore ? 'Lade...' : 'Mehr laden'}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
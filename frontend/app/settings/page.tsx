@@ -3,6 +3,24 @@ import Link from 'next/link';
 import { useEffect, useState } from 'react';
 import DynamicList from '../components/DynamicList';
 
+// Fortschritt des CV-Imports (Worker -> cv_progress Event über /ws)
+interface IngestState {
+  ingest_id: string;
+  stage: string;
+  progress: number;
+  data?: any;
+  error?: string;
+}
+
+const INGEST_LABELS: Record<string, string> = {
+  queued: 'In Warteschlange...',
+  started: 'Import gestartet...',
+  cached: 'Bekannter Lebenslauf, übernehme Ergebnis...',
+  extracting: 'Lese PDF...',
+  parsing: 'KI analysiert den Lebenslauf...',
+  saving: 'Speichere Profil...',
+};
+
 export default function Settings() {
   const [formData, setFormData] = useState({
     role: '',
@@ -61,17 +79,42 @@ export default function Settings() {
     }
   };
 
+  // Wartet auf das Ende des Imports; der Status-Abruf fängt Events ab, die vor dem Verbindungsaufbau kamen
+  const waitForIngest = (ws: WebSocket, ingestId: string) => new Promise<any>((resolve, reject) => {
+    const handle = (state: IngestState) => {
+      if (state.stage === 'done') resolve(state.data);
+      else if (state.stage === 'failed') reject(new Error(state.error || 'Import fehlgeschlagen'));
+      else setStatus(`${INGEST_LABELS[state.stage] || 'Analysiere...'} (${state.progress}%)`);
+    };
+    // Ergebnis (geparster CV) und Fehlertext kommen nur über den Status-Endpunkt, nicht über /ws
+    const fetchStatus = () => fetch(`${process.env.NEXT_PUBLIC_API_URL}/settings/upload-cv/${ingestId}`)
+      .then(res => (res.ok ? res.json() : null))
+      .then(state => { if (state) handle(state); })
+      .catch(() => {});
+    ws.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.type !== 'cv_progress' || data.ingest_id !== ingestId) return;
+      if (data.stage === 'done' || data.stage === 'failed') fetchStatus();
+      else handle(data);
+    };
+    ws.onclose = () => reject(new Error('Verbindung verloren'));
+    fetchStatus();
+  });
+
   const handleFileUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
     if (!e.target.files || e.target.files.length === 0) return;
 
     const file = e.target.files[0];
     setUploading(true);
-    setStatus("Analysiere PDF... (kann 10-20sek dauern)");
+    setStatus("Lade PDF hoch...");
 
     const uploadData = new FormData();
     uploadData.append("file", file);
 
+    const ws = new WebSocket(`${process.env.NEXT_PUBLIC_API_WS_URL}/ws`);
     try {
+      await new Promise((resolve, reject) => { ws.onopen = resolve; ws.onerror = reject; });
+
       const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/settings/upload-cv`, {
         method: 'POST',
         body: uploadData,
@@ -79,8 +122,8 @@ export default function Settings() {
 
       if (!res.ok) throw new Error("Upload failed");
 
-      const result = await res.json();
-      const data = result.data;
+      const { ingest_id } = await res.json();
+      const data = await waitForIngest(ws, ingest_id);
 
       setFormData({
         role: data.role || formData.role || '',
@@ -95,8 +138,10 @@ export default function Settings() {
       setStatus("CV erfolgreich importiert! 🎉");
     } catch (error) {
       console.error(error);
-      setStatus("Fehler beim Import ❌");
+      setStatus(`Fehler beim Import ❌ ${error instanceof Error ? error.message : ''}`);
     } finally {
+      ws.onclose = null;
+      ws.close();
       setUploading(false);
     }
   };
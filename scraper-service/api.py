@@ -1,14 +1,23 @@
 import os
 import logging
+from typing import List, Optional
+import requests
 from celery import chain
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from celery_config import celery_app
+import redis
+from celery_config import celery_app, REDIS_URL
+from browser_pool import get_pool_metrics
+from fetcher import METRICS_KEY as FETCHER_METRICS_KEY
+import crawl_runs
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Quelle für die gespeicherten job_urls (GET /settings am ai-api)
+AI_API_URL = os.getenv("AI_API_URL", "http://ai-api:8000")
+
 app = FastAPI()
 allowed_origins = [origin.strip() for origin in os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")]
 logger.info(f"Allowed origins: {allowed_origins}")
@@ -24,15 +33,64 @@ class JobSearch(BaseModel):
     query: str
     location: str
 
+class BulkSearch(BaseModel):
+    # Ohne Liste werden alle in den Einstellungen hinterlegten job_urls gecrawlt
+    urls: Optional[List[str]] = None
+
+def crawl_chain(url, run_id):
+    # Schlägt ein Glied fehl, gibt der errback das Token der Quelle im Crawl-Lauf frei
+    on_error = celery_app.signature('scraper.source_failed', kwargs={"run_id": run_id, "source": url}, queue='scraper_queue')
+    return chain(
+        celery_app.signature('scraper.fetch_links', args=[url], kwargs={"run_id": run_id}, queue='scraper_queue').on_error(on_error),
+        celery_app.signature('ai.filter_urls', kwargs={"run_id": run_id}, queue='ai_queue').on_error(on_error),
+        celery_app.signature('scraper.schedule_crawls', kwargs={"run_id": run_id, "source": url}, queue='scraper_queue').on_error(on_error)
+    )
+
+def configured_job_urls():
+    try:
+        res = requests.get(f"{AI_API_URL}/settings", timeout=10)
+        res.raise_for_status()
+        return res.json().get("job_urls") or []
+    except (requests.RequestException, ValueError) as e:
+        logger.error(f"Could not load job_urls from {AI_API_URL}/settings: {e}")
+        raise HTTPException(status_code=502, detail="Einstellungen konnten nicht geladen werden.")
+
 @app.post("/search")
-async def search_jobs(search: JobSearch):
+def search_jobs(search: JobSearch):
     if not search.query.startswith("http"):
         return {"status": "Error", "message": "URL muss mit http(s) beginnen."}
-        
-    workflow = chain(
-        celery_app.signature('scraper.fetch_links', args=[search.query], queue='scraper_queue'),
-        celery_app.signature('ai.filter_urls', queue='ai_queue'),
-        celery_app.signature('scraper.schedule_crawls', queue='scraper_queue')
-    )
-    workflow.apply_async()
-    return {"status": "Started"}
+
+    # Eigene Run-ID für Fortschritt und Abschluss (GET /crawls/{run_id} am ai-api)
+    r = redis.from_url(REDIS_URL)
+    run_id = crawl_runs.create(r, [search.query])
+    crawl_chain(search.query, run_id).apply_async()
+    return {"status": "Started", "run_id": run_id}
+
+@app.post("/search/bulk")
+def search_jobs_bulk(search: BulkSearch):
+    urls = search.urls if search.urls is not None else configured_job_urls()
+    urls = list(dict.fromkeys(url.strip() for url in urls if url and url.strip()))
+    invalid = [url for url in urls if not url.startswith("http")]
+    if invalid:
+        return {"status": "Error", "message": f"URL muss mit http(s) beginnen: {', '.join(invalid)}"}
+    if not urls:
+        return {"status": "Error", "message": "Keine Job-URLs hinterlegt."}
+
+    # Ein Lauf für alle Quellen; die Ketten laufen parallel, begrenzt durch die Slots in crawl_limits
+    r = redis.from_url(REDIS_URL)
+    run_id = crawl_runs.create(r, urls)
+    for url in urls:
+        crawl_chain(url, run_id).apply_async()
+    logger.info(f"Bulk crawl {run_id} started for {len(urls)} sources.")
+    return {"status": "Started", "run_id": run_id, "sources": len(urls)}
+
+
+@app.get("/metrics/browser-pool")
+def browser_pool_metrics():
+    r = redis.from_url(REDIS_URL)
+    return get_pool_metrics(r)
+
+@app.get("/metrics/fetcher")
+def fetcher_metrics():
+    r = redis.from_url(REDIS_URL, decode_responses=True)
+    return {k: int(v) for k, v in r.hgetall(FETCHER_METRICS_KEY).items()}
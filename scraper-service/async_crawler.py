@@ -0,0 +1,211 @@
+import os
+import asyncio
+import logging
+import threading
+import time
+
+import redis
+from playwright.async_api import async_playwright
+
+from celery_config import REDIS_URL
+from browser_pool import (
+    LAUNCH_ARGS, USER_AGENT, VIEWPORT, METRICS_KEY, BROWSER_MAX_PAGES, BROWSER_MAX_MEMORY_MB, _process_tree_rss_mb,
+)
+from fetcher import try_http_tier
+from page_readiness import block_resources_async, wait_until_ready_async
+
+logger = logging.getLogger(__name__)
+
+SCRAPER_MAX_IN_FLIGHT = int(os.getenv("SCRAPER_MAX_IN_FLIGHT", "5"))
+
+
+async def _fetch_page(browser, context, url):
+    page = await context.new_page()
+    page.on("crash", browser.on_crash)
+    start_time = time.time()
+    try:
+        logger.info(f"Navigating to {url}...")
+        await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+        await wait_until_ready_async(page, url)
+        content = await page.content()
+        logger.info(f"✅ Successfully fetched {len(content)} bytes from {url} in {time.time() - start_time:.2f}s")
+        return content
+    except Exception as e:
+        logger.error(f"❌ Playwright Error fetching {url}: {e}")
+        return None
+    finally:
+        browser.pages_served += 1
+        try:
+            await page.close()
+        except Exception:
+            browser.crashed = True
+
+
+class AsyncBrowser:
+    """Long-lived async Chromium for batch crawls, one per worker process.
+
+    Lives on its own event loop thread so it survives between ``crawl_batch``
+    calls. Recycled like the sync pool (``BROWSER_MAX_PAGES``,
+    ``BROWSER_MAX_MEMORY_MB``, crash) and counted in the same metrics.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="async-browser", daemon=True).start()
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.pages_served = 0
+        self.crashed = False
+        # Laufende Batches: recycelt wird nur, wenn keiner den Browser benutzt
+        self.active = 0
+        self.redis = redis.from_url(REDIS_URL)
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def on_crash(self, *_):
+        logger.warning("💥 Page crashed in async browser.")
+        self.crashed = True
+
+    def _on_disconnected(self, *_):
+        if self.browser is not None:
+            logger.warning("💥 Async browser disconnected unexpectedly.")
+            self.crashed = True
+
+    def _metric(self, *fields):
+        try:
+            pipe = self.redis.pipeline()
+            for field in fields:
+                pipe.hincrby(METRICS_KEY, field, 1)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Browser pool metrics unavailable: {e}")
+
+    def _recycle_reason(self):
+        if self.crashed or not self.browser.is_connected():
+            return "crash"
+        if self.pages_served >= BROWSER_MAX_PAGES:
+            return "max_pages"
+        if BROWSER_MAX_MEMORY_MB and _process_tree_rss_mb(self.pid) > BROWSER_MAX_MEMORY_MB:
+            return "memory"
+        return None
+
+    async def _close_browser(self):
+        browser, self.browser, self.context = self.browser, None, None
+        if browser is None:
+            return
+        try:
+            await browser.close()
+        except Exception as e:
+            logger.debug(f"Ignoring error while closing async browser: {e}")
+
+    async def lease(self):
+        """Context for one batch; call ``release()`` when the batch is done."""
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+        reason = self._recycle_reason() if self.browser is not None and not self.active else None
+        if reason:
+            logger.info(f"♻️ Recycling async browser ({reason}, {self.pages_served} pages served)")
+            await self._close_browser()
+            self._metric(f"recycles:{reason}")
+
+        if self.browser is None:
+            start_time = time.time()
+            self.browser = await self.playwright.chromium.launch(headless=True, args=LAUNCH_ARGS)
+            self.browser.on("disconnected", self._on_disconnected)
+            self.context = await self.browser.new_context(user_agent=USER_AGENT, viewport=VIEWPORT)
+            await self.context.route("**/*", block_resources_async)
+            self.pages_served = 0
+            self.crashed = False
+            logger.info(f"🚀 Cold launch of async browser in {time.time() - start_time:.2f}s")
+            self._metric("leases", "cold_launches")
+        else:
+            self._metric("leases", "pool_hits")
+        self.active += 1
+        return self.context
+
+    def release(self):
+        self.active -= 1
+
+    async def _shutdown(self):
+        await self._close_browser()
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+
+    def close(self):
+        try:
+            self.run(self._shutdown())
+        except Exception as e:
+            logger.debug(f"Ignoring error while stopping async browser: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class _BatchLease:
+    # Holt den Browser erst, wenn die erste URL des Batches den Browser-Tier braucht
+    def __init__(self, browser):
+        self.browser = browser
+        self.context = None
+        self.lock = asyncio.Lock()
+
+    async def get_context(self):
+        async with self.lock:
+            if self.context is None:
+                self.context = await self.browser.lease()
+            return self.context
+
+    def release(self):
+        if self.context is not None:
+            self.browser.release()
+
+
+async def _crawl(browser, urls, on_page, max_in_flight):
+    # Begrenzt HTTP- und Browser-Tier gemeinsam; on_page läuft außerhalb, damit Slots schnell frei werden
+    semaphore = asyncio.Semaphore(max_in_flight)
+    batch = _BatchLease(browser)
+    try:
+        async def handle(url):
+            async with semaphore:
+                html = await asyncio.to_thread(try_http_tier, url)
+                if html is None:
+                    html = await _fetch_page(browser, await batch.get_context(), url)
+            # Parsing und Task-Versand blockieren, daher außerhalb des Event-Loops
+            await asyncio.to_thread(on_page, url, html)
+
+        results = await asyncio.gather(*(handle(url) for url in urls), return_exceptions=True)
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error processing {url} in batch: {result}")
+    finally:
+        batch.release()
+
+
+_browser = None
+_browser_lock = threading.Lock()
+
+
+def get_async_browser():
+    # Pro Worker-Prozess ein eigener Browser (Playwright-Handles überleben keinen Fork)
+    global _browser
+    with _browser_lock:
+        if _browser is None or _browser.pid != os.getpid():
+            _browser = AsyncBrowser()
+        return _browser
+
+
+def shutdown_async_browser():
+    global _browser
+    with _browser_lock:
+        if _browser is not None and _browser.pid == os.getpid():
+            logger.info("Closing async browser.")
+            _browser.close()
+        _browser = None
+
+
+def crawl_batch(urls, on_page, max_in_flight=SCRAPER_MAX_IN_FLIGHT):
+    """Fetch ``urls`` concurrently in the process's async browser, calling ``on_page(url, html)`` per page."""
+    # Eigene Loop im Hintergrund-Thread: der Sync-Browserpool hält im Hauptthread eine laufende Event-Loop
+    browser = get_async_browser()
+    browser.run(_crawl(browser, urls, on_page, max_in_flight))
@@ -0,0 +1,208 @@
+import os
+import logging
+import time
+from contextlib import contextmanager
+
+import redis
+from playwright.sync_api import sync_playwright
+
+from celery_config import REDIS_URL
+from page_readiness import block_resources
+
+logger = logging.getLogger(__name__)
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "1"))
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "100"))
+BROWSER_MAX_MEMORY_MB = int(os.getenv("BROWSER_MAX_MEMORY_MB", "1024"))
+
+METRICS_KEY = "metrics:browser_pool"
+
+LAUNCH_ARGS = ["--disable-blink-features=AutomationControlled", "--no-sandbox", "--disable-setuid-sandbox"]
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+VIEWPORT = {"width": 1920, "height": 1080}
+
+
+def _process_tree_rss_mb(root_pid):
+    # Summe des RSS aller Kindprozesse (Playwright-Driver + Chromium), Linux only
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    stack = list(children.get(root_pid, []))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, ValueError, IndexError):
+            continue
+    return total / (1024 * 1024)
+
+
+class BrowserSlot:
+    def __init__(self, index):
+        self.index = index
+        self.browser = None
+        self.context = None
+        self.pages_served = 0
+        self.crashed = False
+        self.in_use = False
+
+    @property
+    def alive(self):
+        return self.browser is not None and not self.crashed and self.browser.is_connected()
+
+    def _on_disconnected(self, *_):
+        if self.browser is not None:
+            logger.warning(f"💥 Browser slot {self.index} disconnected unexpectedly.")
+            self.crashed = True
+
+    def _on_page_crash(self, *_):
+        logger.warning(f"💥 Page crashed in browser slot {self.index}.")
+        self.crashed = True
+
+    def launch(self, playwright):
+        self.browser = playwright.chromium.launch(headless=True, args=LAUNCH_ARGS)
+        self.browser.on("disconnected", self._on_disconnected)
+        self.context = self.browser.new_context(user_agent=USER_AGENT, viewport=VIEWPORT)
+        self.context.route("**/*", block_resources)
+        self.pages_served = 0
+        self.crashed = False
+
+    def close(self):
+        browser, self.browser, self.context = self.browser, None, None
+        if browser is None:
+            return
+        try:
+            browser.close()
+        except Exception as e:
+            logger.debug(f"Ignoring error while closing browser slot {self.index}: {e}")
+
+
+class BrowserPool:
+    """Long-lived Chromium instances for one worker process.
+
+    Pages are leased via ``lease_page()``; browsers are recycled after
+    ``BROWSER_MAX_PAGES`` pages, when the process tree exceeds
+    ``BROWSER_MAX_MEMORY_MB`` or after a crash.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE):
+        self.pid = os.getpid()
+        self.playwright = None
+        self.slots = [BrowserSlot(i) for i in range(max(1, size))]
+        self.redis = redis.from_url(REDIS_URL)
+
+    def _metric(self, *fields):
+        try:
+            pipe = self.redis.pipeline()
+            for field in fields:
+                pipe.hincrby(METRICS_KEY, field, 1)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Browser pool metrics unavailable: {e}")
+
+    def _recycle_reason(self, slot):
+        if slot.crashed or (slot.browser is not None and not slot.browser.is_connected()):
+            return "crash"
+        if slot.pages_served >= BROWSER_MAX_PAGES:
+            return "max_pages"
+        if BROWSER_MAX_MEMORY_MB and _process_tree_rss_mb(self.pid) > BROWSER_MAX_MEMORY_MB:
+            return "memory"
+        return None
+
+    def _acquire_slot(self):
+        if self.playwright is None:
+            self.playwright = sync_playwright().start()
+
+        slot = next((s for s in self.slots if not s.in_use and s.alive), None)
+        if slot is None:
+            slot = next((s for s in self.slots if not s.in_use), None)
+        if slot is None:
+            raise RuntimeError("Browser pool exhausted")
+
+        reason = self._recycle_reason(slot) if slot.browser is not None else None
+        if reason:
+            logger.info(f"♻️ Recycling browser slot {slot.index} ({reason}, {slot.pages_served} pages served)")
+            slot.close()
+            self._metric(f"recycles:{reason}")
+
+        if slot.browser is None:
+            start_time = time.time()
+            slot.launch(self.playwright)
+            logger.info(f"🚀 Cold launch of browser slot {slot.index} in {time.time() - start_time:.2f}s")
+            self._metric("leases", "cold_launches")
+        else:
+            self._metric("leases", "pool_hits")
+
+        slot.in_use = True
+        return slot
+
+    @contextmanager
+    def lease_page(self):
+        slot = self._acquire_slot()
+        page = None
+        try:
+            page = slot.context.new_page()
+            page.on("crash", slot._on_page_crash)
+            yield page
+        except Exception:
+            if not slot.alive:
+                self._metric("crashes")
+            raise
+        finally:
+            slot.pages_served += 1
+            slot.in_use = False
+            if page is not None:
+                try:
+                    page.close()
+                except Exception:
+                    slot.crashed = True
+
+    def close(self):
+        for slot in self.slots:
+            slot.close()
+        if self.playwright is not None:
+            try:
+                self.playwright.stop()
+            except Exception as e:
+                logger.debug(f"Ignoring error while stopping Playwright: {e}")
+            self.playwright = None
+
+
+_pool = None
+
+
+def get_pool():
+    # Pro Worker-Prozess ein eigener Pool (Playwright-Handles überleben keinen Fork)
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        _pool = BrowserPool()
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None and _pool.pid == os.getpid():
+        logger.info("Closing browser pool.")
+        _pool.close()
+    _pool = None
+
+
+def get_pool_metrics(r):
+    raw = r.hgetall(METRICS_KEY)
+    metrics = {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()}
+    leases = metrics.get("leases", 0)
+    metrics["hit_rate"] = round(metrics.get("pool_hits", 0) / leases, 4) if leases else None
+    return metrics
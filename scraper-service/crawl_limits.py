@@ -0,0 +1,91 @@
+import os
+import time
+import random
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# Gleichzeitig gelesene Listing-Seiten über alle Worker (Bulk-Crawl mit vielen Quellen)
+CRAWL_MAX_SOURCES = int(os.getenv("CRAWL_MAX_SOURCES", "8"))
+# Gleichzeitige Tasks pro Domain (Listing und Detailseiten), um einzelne Karriereseiten nicht zu überlasten
+CRAWL_MAX_PER_DOMAIN = int(os.getenv("CRAWL_MAX_PER_DOMAIN", "2"))
+# Abgestürzte Worker geben ihren Slot nach spätestens so vielen Sekunden frei
+CRAWL_SLOT_LEASE = int(os.getenv("CRAWL_SLOT_LEASE", "600"))
+CRAWL_SLOT_RETRY_SECONDS = float(os.getenv("CRAWL_SLOT_RETRY_SECONDS", "5"))
+
+GLOBAL_SLOTS_KEY = "crawl:slots:sources"
+
+# Verfallene Leases entfernen, dann einen Slot belegen, wenn noch einer frei ist
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, tonumber(ARGV[1]) - tonumber(ARGV[3]))
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then return 0 end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def domain_slots_key(url):
+    return f"crawl:slots:domain:{urlparse(url).netloc}"
+
+
+def acquire(r, key, limit, token):
+    if limit <= 0:
+        return True
+    return r.register_script(_ACQUIRE_SCRIPT)(keys=[key], args=[time.time(), limit, CRAWL_SLOT_LEASE, token]) == 1
+
+
+@contextmanager
+def slots(r, limits):
+    """Hold one slot in each (key, limit) semaphore or raise SlotUnavailable without holding any."""
+    token = uuid.uuid4().hex
+    held = []
+    try:
+        for key, limit in limits:
+            if not acquire(r, key, limit, token):
+                raise SlotUnavailable(key)
+            held.append(key)
+        yield
+    finally:
+        for key in held:
+            r.zrem(key, token)
+
+
+@contextmanager
+def domain_slots(r, url, wanted):
+    """Hold up to ``wanted`` slots of the URL's domain; yields how many (at least one) or raises SlotUnavailable."""
+    if CRAWL_MAX_PER_DOMAIN <= 0:
+        yield wanted
+        return
+    key = domain_slots_key(url)
+    tokens = []
+    try:
+        # Ein Slot pro gleichzeitiger Seite: ein Batch darf die Domain nicht stärker belasten als Einzel-Tasks
+        for _ in range(min(wanted, CRAWL_MAX_PER_DOMAIN)):
+            token = uuid.uuid4().hex
+            if not acquire(r, key, CRAWL_MAX_PER_DOMAIN, token):
+                break
+            tokens.append(token)
+        if not tokens:
+            raise SlotUnavailable(key)
+        yield len(tokens)
+    finally:
+        if tokens:
+            r.zrem(key, *tokens)
+
+
+def source_limits(url):
+    return [(GLOBAL_SLOTS_KEY, CRAWL_MAX_SOURCES), (domain_slots_key(url), CRAWL_MAX_PER_DOMAIN)]
+
+
+def domain_limits(url):
+    return [(domain_slots_key(url), CRAWL_MAX_PER_DOMAIN)]
+
+
+def retry_countdown(retries):
+    # Leichte Streuung, damit wartende Tasks nicht gleichzeitig wieder anklopfen
+    return CRAWL_SLOT_RETRY_SECONDS * (1 + min(retries, 5) * 0.5) * random.uniform(0.5, 1.5)
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import uuid
+import logging
+
+import events
+
+logger = logging.getLogger(__name__)
+
+# Gemeinsam mit ai-service/crawl_runs.py: ein Crawl-Lauf ist ein Redis-Hash crawl:<run_id>
+# mit Zählern und einem Countdown-Latch ("pending"). Jede Quelle hält ein Token im Latch, bis ihre
+# URLs eingeplant sind, danach zählt jede URL einzeln herunter
+CRAWL_RUN_TTL = int(os.getenv("CRAWL_RUN_TTL", str(7 * 24 * 3600)))
+# Läufe, die so lange nicht fertig werden (verlorene Tasks), zählen nicht mehr als aktiv
+CRAWL_RUN_TIMEOUT = int(os.getenv("CRAWL_RUN_TIMEOUT", "3600"))
+# system:crawling läuft ohne Aktivität ab (verlorene Worker) und wird bei jedem Fortschritt verlängert
+CRAWLING_TTL = int(os.getenv("CRAWLING_TTL", "600"))
+CRAWL_PROGRESS_INTERVAL_MS = int(os.getenv("CRAWL_PROGRESS_INTERVAL_MS", "1000"))
+
+ACTIVE_RUNS_KEY = "crawl:active"
+CRAWLING_KEY = "system:crawling"
+COUNTERS = ("sources", "sources_done", "sources_failed", "links", "relevant", "scheduled", "fetched", "analyzed", "skipped", "failed", "pending")
+
+# Zählt URLs (bzw. Quellen) im Latch herunter, jede nur einmal: die Mitglieder landen im Set
+# crawl:<run_id>:done, Wiederholungen (Replay eines Batches, requeue) ändern nichts mehr.
+# Bei 0 wird der Lauf genau einmal abgeschlossen
+_RECORD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+local n = 0
+for i = 6, #ARGV do n = n + redis.call('SADD', KEYS[3], ARGV[i]) end
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+if n > 0 then
+  redis.call('HINCRBY', KEYS[1], ARGV[1], n)
+  if ARGV[5] ~= '' then redis.call('HINCRBY', KEYS[1], ARGV[5], n) end
+end
+local pending = redis.call('HINCRBY', KEYS[1], 'pending', -n)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+if pending <= 0 and redis.call('HGET', KEYS[1], 'status') == 'running' then
+  local status = 'completed'
+  if tonumber(redis.call('HGET', KEYS[1], 'sources_failed') or 0) >= tonumber(redis.call('HGET', KEYS[1], 'sources') or 1) then
+    status = 'failed'
+  end
+  redis.call('HSET', KEYS[1], 'status', status, 'finished_at', ARGV[2])
+  redis.call('ZREM', KEYS[2], ARGV[4])
+  return 1
+end
+return 0
+"""
+
+# Nimmt nur noch nicht eingeplante URLs in den Latch auf (dieselbe URL aus zwei Quellen eines Laufs)
+_SCHEDULE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return {} end
+local added = {}
+for i = 2, #ARGV do
+  if redis.call('SADD', KEYS[2], ARGV[i]) == 1 then added[#added + 1] = ARGV[i] end
+end
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+redis.call('HINCRBY', KEYS[1], 'scheduled', #added)
+redis.call('HINCRBY', KEYS[1], 'pending', #added)
+return added
+"""
+
+
+def run_key(run_id):
+    return f"crawl:{run_id}"
+
+
+def create(r, urls):
+    """Start one crawl run over the given listing URLs and return its id."""
+    run_id = uuid.uuid4().hex
+    now = time.time()
+    counters = {**dict.fromkeys(COUNTERS, 0), "sources": len(urls), "pending": len(urls)}
+    pipe = r.pipeline()
+    pipe.hset(run_key(run_id), mapping={"run_id": run_id, "urls": json.dumps(urls), "status": "running", "started_at": now, **counters})
+    pipe.expire(run_key(run_id), CRAWL_RUN_TTL)
+    pipe.zadd(ACTIVE_RUNS_KEY, {run_id: now})
+    pipe.setex(CRAWLING_KEY, CRAWLING_TTL, "true")
+    pipe.execute()
+    return run_id
+
+
+def update(r, run_id, **counters):
+    """Add to counters that do not touch the latch (links, relevant, fetched, sources_failed)."""
+    if not run_id:
+        return
+    pipe = r.pipeline()
+    for field, n in counters.items():
+        pipe.hincrby(run_key(run_id), field, n)
+    pipe.expire(CRAWLING_KEY, CRAWLING_TTL)
+    pipe.execute()
+    _publish_progress(r, run_id)
+
+
+def schedule(r, run_id, urls):
+    """Arm the latch with ``urls`` before their tasks are sent; returns the URLs not yet in the run."""
+    if not run_id:
+        return list(urls)
+    if not urls:
+        return []
+    added = r.register_script(_SCHEDULE_SCRIPT)(keys=[run_key(run_id), f"{run_key(run_id)}:scheduled"], args=[CRAWL_RUN_TTL, *urls])
+    return [url.decode() if isinstance(url, bytes) else url for url in added]
+
+
+def record(r, run_id, outcome, urls):
+    """Count URLs as analyzed, skipped or failed (each URL once); completes the run when none are pending."""
+    urls = [url for url in urls if url]
+    if not run_id or not urls:
+        return False
+    done = _record(r, run_id, outcome, urls)
+    if not done:
+        _publish_progress(r, run_id)
+    return done
+
+
+def source_done(r, run_id, source, failed=False):
+    """Release a source's latch token once its URLs are scheduled, there are none, or its chain failed."""
+    if not run_id:
+        return False
+    return _record(r, run_id, "sources_done", [f"source:{source}"], extra="sources_failed" if failed else "")
+
+
+def stash(r, run_id, name, value):
+    """Keep a value with the run until a later chain step commits it (see ``pop_stash``)."""
+    r.hset(run_key(run_id), f"stash:{name}", value)
+
+
+def pop_stash(r, run_id, name):
+    pipe = r.pipeline()
+    pipe.hget(run_key(run_id), f"stash:{name}")
+    pipe.hdel(run_key(run_id), f"stash:{name}")
+    value = pipe.execute()[0]
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _record(r, run_id, outcome, members, extra=""):
+    result = r.register_script(_RECORD_SCRIPT)(
+        keys=[run_key(run_id), ACTIVE_RUNS_KEY, f"{run_key(run_id)}:done"],
+        args=[outcome, time.time(), CRAWL_RUN_TTL, run_id, extra, *members],
+    )
+    if result != 1:
+        r.expire(CRAWLING_KEY, CRAWLING_TTL)
+        return False
+    _on_finished(r, run_id)
+    return True
+
+
+def active_runs(r):
+    # Hängengebliebene Läufe nach CRAWL_RUN_TIMEOUT austragen
+    r.zremrangebyscore(ACTIVE_RUNS_KEY, 0, time.time() - CRAWL_RUN_TIMEOUT)
+    return r.zcard(ACTIVE_RUNS_KEY)
+
+
+def _on_finished(r, run_id):
+    remaining = active_runs(r)
+    if not remaining:
+        r.delete(CRAWLING_KEY)
+    run = summarize(r.hgetall(run_key(run_id)))
+    logger.info(f"🏁 Crawl run {run_id} {run.get('status')}: {run.get('analyzed')} analyzed, {run.get('skipped')} skipped, {run.get('failed')} failed in {run.get('duration_seconds')}s")
+    events.publish(r, {"type": "crawl_completed", "run": run, "active_runs": remaining})
+
+
+def _publish_progress(r, run_id):
+    # Höchstens ein crawl_progress Event pro Lauf und Intervall
+    if not r.set(f"{run_key(run_id)}:progress", "1", nx=True, px=CRAWL_PROGRESS_INTERVAL_MS):
+        return
+    events.publish(r, {"type": "crawl_progress", "run": summarize(r.hgetall(run_key(run_id)))})
+
+
+def summarize(data):
+    """Run hash from Redis -> JSON dict with counters, duration and throughput."""
+    if not data:
+        return {}
+    data = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v) for k, v in data.items()}
+    run = {"run_id": data.get("run_id"), "urls": json.loads(data.get("urls") or "[]"), "status": data.get("status")}
+    run.update({field: int(data.get(field) or 0) for field in COUNTERS})
+    # Erledigte URLs: Latch ohne die Tokens der noch nicht eingeplanten Quellen
+    run["done"] = max(run["scheduled"] - max(run["pending"] - (run["sources"] - run["sources_done"]), 0), 0)
+
+    started_at = float(data.get("started_at") or 0)
+    finished_at = float(data["finished_at"]) if data.get("finished_at") else None
+    duration = max((finished_at or time.time()) - started_at, 0.001)
+    run["started_at"] = started_at
+    run["finished_at"] = finished_at
+    run["duration_seconds"] = round(duration, 1)
+    run["pages_per_minute"] = round(run["fetched"] / duration * 60, 1)
+    run["jobs_per_minute"] = round(run["analyzed"] / duration * 60, 1)
+    return run
@@ -0,0 +1,15 @@
+import os
+import json
+
+# Gemeinsam mit ai-service/events.py: Echtzeit-Events laufen über einen Redis Stream statt Pub/Sub,
+# damit die API-Replikas nach einem Reconnect ab ihrem letzten Offset weiterlesen können
+EVENTS_STREAM = "events:job_updates"
+EVENTS_MAXLEN = int(os.getenv("EVENTS_MAXLEN", "10000"))
+# Schema-Version jedes Events ("v"); bei inkompatiblen Änderungen erhöhen
+EVENT_SCHEMA_VERSION = 1
+
+
+def publish(r, event):
+    """Append an event (dict or JSON string) to the shared stream; works on clients and pipelines."""
+    payload = event if isinstance(event, str) else json.dumps({"v": EVENT_SCHEMA_VERSION, **event}, separators=(",", ":"))
+    return r.xadd(EVENTS_STREAM, {"data": payload}, maxlen=EVENTS_MAXLEN, approximate=True)
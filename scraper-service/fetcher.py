@@ -0,0 +1,158 @@
+import os
+import re
+import logging
+import time
+from urllib.parse import urlparse
+
+import redis
+import requests
+from requests.adapters import HTTPAdapter
+
+from celery_config import REDIS_URL
+from browser_pool import USER_AGENT
+import page_cache
+
+logger = logging.getLogger(__name__)
+
+FETCHER_TIER_TTL = int(os.getenv("FETCHER_TIER_TTL", str(7 * 24 * 3600)))
+HTTP_TIMEOUT = float(os.getenv("FETCHER_HTTP_TIMEOUT", "15"))
+MIN_BODY_BYTES = 512
+MIN_TEXT_RATIO = 0.02
+
+TIER_HTTP = "http"
+TIER_BROWSER = "browser"
+METRICS_KEY = "metrics:fetcher"
+
+# Server hat 304 geliefert: Seite seit dem letzten Crawl unverändert
+NOT_MODIFIED = object()
+
+_JS_SHELL_MARKERS = re.compile(
+    r"enable javascript|javascript (is )?(required|disabled)|<div id=\"(root|app|__next)\">\s*</div>",
+    re.I,
+)
+_TAGS = re.compile(r"<(script|style)[^>]*>.*?</\1>|<[^>]+>", re.S | re.I)
+
+r = redis.from_url(REDIS_URL, decode_responses=True)
+
+_session = None
+
+
+def get_session():
+    # Keep-Alive Session pro Prozess, Verbindungen werden pro Host wiederverwendet
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=1)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+        _session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "de-DE,de;q=0.9,en;q=0.8",
+        })
+    return _session
+
+
+def _metric(field):
+    try:
+        r.hincrby(METRICS_KEY, field, 1)
+    except Exception as e:
+        logger.debug(f"Fetcher metrics unavailable: {e}")
+
+
+def _tier_key(url, kind):
+    # Listing und Detailseiten getrennt: eine JS-Jobbörse heißt nicht, dass die Detailseiten JS brauchen
+    return f"fetcher:tier:{kind}:{urlparse(url).netloc}"
+
+
+def get_domain_tier(url, kind="detail"):
+    try:
+        return r.get(_tier_key(url, kind))
+    except Exception:
+        return None
+
+
+def set_domain_tier(url, tier, kind="detail"):
+    try:
+        r.setex(_tier_key(url, kind), FETCHER_TIER_TTL, tier)
+    except Exception as e:
+        logger.debug(f"Could not store fetch tier for {url}: {e}")
+
+
+def looks_like_js_shell(html):
+    """True only on real client-side-rendering signals; these pin the domain to the browser tier."""
+    if not html or len(html) < MIN_BODY_BYTES:
+        return True
+    if _JS_SHELL_MARKERS.search(html):
+        return True
+    text = re.sub(r"\s+", " ", _TAGS.sub(" ", html)).strip()
+    return len(text) / len(html) < MIN_TEXT_RATIO
+
+
+def has_job_heading(html):
+    return bool(re.search(r"<h1[\s>]", html, re.I))
+
+
+def fetch_http(url):
+    headers = page_cache.conditional_headers(page_cache.get(url))
+    try:
+        response = get_session().get(url, headers=headers, timeout=HTTP_TIMEOUT)
+    except requests.RequestException as e:
+        logger.info(f"HTTP fetch failed for {url}: {e}")
+        return None
+    if response.status_code == 304:
+        return NOT_MODIFIED
+    if response.status_code != 200 or "html" not in response.headers.get("Content-Type", ""):
+        logger.info(f"HTTP fetch for {url} returned {response.status_code} ({response.headers.get('Content-Type')})")
+        return None
+    return response
+
+
+def try_http_tier(url, kind="detail", validators=None):
+    """Return the page via plain HTTP, NOT_MODIFIED, or None if this page (or domain) needs a browser.
+
+    With ``validators`` given, ETag/Last-Modified are collected there instead of written to the
+    page cache; the caller stores them once the page has been fully processed.
+    """
+    # Validatoren nur für HTTP-Domains: bei JS-Shells sagt ein 304 nichts über den gerenderten Inhalt
+    if get_domain_tier(url, kind) == TIER_BROWSER:
+        _metric("browser_direct")
+        return None
+
+    start_time = time.time()
+    response = fetch_http(url)
+    if response is NOT_MODIFIED:
+        _metric("not_modified")
+        logger.info(f"♻️ {url} not modified (304).")
+        return NOT_MODIFIED
+    if response is None:
+        # Timeout, 403/429 usw.: nur diese Seite per Browser, Domain nicht festlegen
+        _metric("browser_fallbacks")
+        return None
+    if looks_like_js_shell(response.text):
+        logger.info(f"🔁 {url} looks like a JS shell, escalating {kind} pages of this domain to browser.")
+        set_domain_tier(url, TIER_BROWSER, kind)
+        _metric("browser_fallbacks")
+        return None
+    if kind == "detail" and not has_job_heading(response.text):
+        logger.info(f"🔁 {url} has no <h1> via HTTP, using browser for this page.")
+        _metric("browser_fallbacks")
+        return None
+
+    html = response.text
+    fields = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+    if validators is not None:
+        validators.update(fields)
+    else:
+        page_cache.update(url, **fields)
+    set_domain_tier(url, TIER_HTTP, kind)
+    _metric("http_hits")
+    logger.info(f"⚡ Fetched {len(html)} bytes from {url} via HTTP in {time.time() - start_time:.2f}s")
+    return html
+
+
+def fetch_html(url, browser_fetch, kind="detail", validators=None):
+    html = try_http_tier(url, kind, validators)
+    if html is not None:
+        return html
+    return browser_fetch(url)
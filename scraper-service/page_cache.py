@@ -0,0 +1,65 @@
+import os
+import re
+import hashlib
+import logging
+
+import redis
+
+from celery_config import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+# Gemeinsam mit ai-service/page_cache.py
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", str(30 * 24 * 3600)))
+
+r = redis.from_url(REDIS_URL, decode_responses=True)
+
+
+def _key(url):
+    return "pagecache:" + hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def raw_hash(html):
+    return _sha256(html)
+
+
+def content_hash(text):
+    return _sha256(re.sub(r"\s+", " ", text).strip().lower())
+
+
+def links_hash(links):
+    return _sha256("\n".join(sorted(links)))
+
+
+def get(url):
+    try:
+        return r.hgetall(_key(url))
+    except Exception as e:
+        logger.debug(f"Page cache unavailable for {url}: {e}")
+        return {}
+
+
+def update(url, **fields):
+    fields = {k: v for k, v in fields.items() if v}
+    if not fields:
+        return
+    try:
+        pipe = r.pipeline()
+        pipe.hset(_key(url), mapping=fields)
+        pipe.expire(_key(url), PAGE_CACHE_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"Could not update page cache for {url}: {e}")
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
@@ -0,0 +1,135 @@
+import os
+import asyncio
+import logging
+from urllib.parse import urlparse
+
+import redis
+
+from celery_config import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+READY_TIMEOUT_MS = int(os.getenv("READY_TIMEOUT_MS", "5000"))
+QUIET_WINDOW_MS = int(os.getenv("READY_QUIET_WINDOW_MS", "500"))
+READY_SELECTOR_TTL = 30 * 24 * 3600
+
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+ANALYTICS_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "facebook.net", "connect.facebook.com", "hotjar.com", "clarity.ms", "segment.io", "segment.com",
+    "mixpanel.com", "matomo.cloud", "newrelic.com", "nr-data.net", "linkedin.com/px", "bat.bing.com",
+    "usercentrics.eu", "cookiebot.com", "onetrust.com", "trustarc.com",
+)
+
+# Kandidaten für "Job-Inhalt ist da", vom spezifischsten zum allgemeinsten
+CONTENT_SELECTORS = [
+    '[itemtype*="JobPosting"]',
+    '[class*="job-description"]',
+    '[class*="jobDescription"]',
+    '[class*="job-detail"]',
+    '[data-testid*="job"]',
+    "article",
+    "main h1",
+    "h1",
+]
+
+_FIND_SELECTOR_JS = """(selectors) => selectors.find(sel => {
+    const el = document.querySelector(sel);
+    return el && el.innerText && el.innerText.trim().length >= (sel.endsWith('h1') ? 3 : 200);
+}) || null"""
+
+_QUIESCENCE_JS = """([quietMs, capMs]) => new Promise(resolve => {
+    let timer;
+    const done = () => { observer.disconnect(); resolve(); };
+    const observer = new MutationObserver(() => { clearTimeout(timer); timer = setTimeout(done, quietMs); });
+    observer.observe(document.documentElement || document, {childList: true, subtree: true, characterData: true});
+    timer = setTimeout(done, quietMs);
+    setTimeout(done, capMs);
+})"""
+
+r = redis.from_url(REDIS_URL, decode_responses=True)
+
+
+def should_block(request):
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    url = request.url
+    return any(host in url for host in ANALYTICS_HOSTS)
+
+
+def block_resources(route):
+    if should_block(route.request):
+        route.abort()
+    else:
+        route.continue_()
+
+
+async def block_resources_async(route):
+    if should_block(route.request):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+def _selector_key(url, kind):
+    return f"fetcher:ready:{kind}:{urlparse(url).netloc}"
+
+
+def get_ready_selector(url, kind):
+    try:
+        return r.get(_selector_key(url, kind))
+    except Exception:
+        return None
+
+
+def _store_selector(url, kind, selector):
+    try:
+        if selector:
+            r.setex(_selector_key(url, kind), READY_SELECTOR_TTL, selector)
+        else:
+            r.delete(_selector_key(url, kind))
+    except Exception as e:
+        logger.debug(f"Could not store ready selector for {url}: {e}")
+
+
+def wait_until_ready(page, url, kind="detail"):
+    """Wait for the learned content selector, else network idle (capped) or DOM quiescence."""
+    selector = get_ready_selector(url, kind)
+    if selector:
+        try:
+            page.wait_for_selector(selector, timeout=READY_TIMEOUT_MS)
+            return
+        except Exception:
+            logger.info(f"Ready selector '{selector}' not found on {url}, relearning.")
+            _store_selector(url, kind, None)
+
+    try:
+        page.wait_for_load_state("networkidle", timeout=READY_TIMEOUT_MS)
+    except Exception:
+        page.evaluate(_QUIESCENCE_JS, [QUIET_WINDOW_MS, READY_TIMEOUT_MS])
+
+    learned = page.evaluate(_FIND_SELECTOR_JS, CONTENT_SELECTORS)
+    if learned:
+        logger.info(f"📌 Learned ready selector '{learned}' for {urlparse(url).netloc} ({kind})")
+        _store_selector(url, kind, learned)
+
+
+async def wait_until_ready_async(page, url, kind="detail"):
+    selector = await asyncio.to_thread(get_ready_selector, url, kind)
+    if selector:
+        try:
+            await page.wait_for_selector(selector, timeout=READY_TIMEOUT_MS)
+            return
+        except Exception:
+            logger.info(f"Ready selector '{selector}' not found on {url}, relearning.")
+            await asyncio.to_thread(_store_selector, url, kind, None)
+
+    try:
+        await page.wait_for_load_state("networkidle", timeout=READY_TIMEOUT_MS)
+    except Exception:
+        await page.evaluate(_QUIESCENCE_JS, [QUIET_WINDOW_MS, READY_TIMEOUT_MS])
+
+    learned = await page.evaluate(_FIND_SELECTOR_JS, CONTENT_SELECTORS)
+    if learned:
+        logger.info(f"📌 Learned ready selector '{learned}' for {urlparse(url).netloc} ({kind})")
+        await asyncio.to_thread(_store_selector, url, kind, learned)
@@ -0,0 +1,44 @@
+import os
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Gemeinsam mit ai-service/seen_urls.py: URL -> Zeitpunkt der letzten Analyse
+SEEN_URLS_KEY = "jobs:seen_urls"
+SEEN_URLS_READY_KEY = "jobs:seen_urls:ready"
+SEEN_URLS_WARMING_KEY = "jobs:seen_urls:warming"
+
+# Bekannte URLs nach so vielen Sekunden erneut prüfen (0 = nie); der Re-Check ist dank
+# ETag/Content-Hash günstig und findet geänderte Anzeigen
+SEEN_RECHECK_TTL = int(os.getenv("SEEN_RECHECK_TTL", str(24 * 3600)))
+
+
+def filter_unseen(r, urls, celery_app):
+    """Drop URLs that were already analyzed; returns (urls_to_crawl, skipped_count)."""
+    if not urls:
+        return urls, 0
+
+    if not r.exists(SEEN_URLS_READY_KEY):
+        # Set noch nicht aus der jobs-Tabelle geladen: nichts verwerfen, Warm-Load anstoßen
+        if r.set(SEEN_URLS_WARMING_KEY, "1", nx=True, ex=300):
+            logger.info("Seen-set is cold, triggering ai.warm_seen_urls.")
+            celery_app.send_task("ai.warm_seen_urls", queue="ai_queue")
+        return urls, 0
+
+    scores = r.zmscore(SEEN_URLS_KEY, urls)
+    now = time.time()
+    fresh = []
+    for url, seen_at in zip(urls, scores):
+        if seen_at is None or (SEEN_RECHECK_TTL and now - seen_at > SEEN_RECHECK_TTL):
+            fresh.append(url)
+    return fresh, len(urls) - len(fresh)
+
+
+def mark_checked(r, url):
+    """Restart the recheck interval of a known URL whose page turned out unchanged."""
+    try:
+        # xx: nur bekannte URLs, ein gerade geleertes Set (/reset) nicht wieder befüllen
+        r.zadd(SEEN_URLS_KEY, {url: time.time()}, xx=True)
+    except Exception as e:
+        logger.warning(f"Could not refresh seen timestamp of {url}: {e}")
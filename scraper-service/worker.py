@@ -3,15 +3,23 @@ import json
 import uuid
 import time
 import logging
-import random
 import sys
 from urllib.parse import urljoin, urlparse
 
 from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright
+from celery.signals import worker_process_shutdown
 import redis
 
 from celery_config import celery_app, REDIS_URL
+from browser_pool import get_pool, shutdown_pool
+from async_crawler import crawl_batch, shutdown_async_browser, SCRAPER_MAX_IN_FLIGHT
+from fetcher import fetch_html, NOT_MODIFIED
+import page_cache
+import events
+import crawl_runs
+import crawl_limits
+from page_readiness import wait_until_ready
+from seen_urls import filter_unseen, mark_checked
 
 # Logging Setup
 logging.basicConfig(
@@ -23,37 +31,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def get_html_with_browser(url):
-    logger.info(f"🌐 Launching browser for URL: {url}")
+# "batch": mehrere Seiten pro Task über async Playwright, "single": ein Task pro URL
+CRAWL_MODE = os.getenv("CRAWL_MODE", "batch")
+SCRAPE_BATCH_SIZE = int(os.getenv("SCRAPE_BATCH_SIZE", "20"))
+
+@worker_process_shutdown.connect
+def close_browser_pool(**kwargs):
+    shutdown_pool()
+    shutdown_async_browser()
+
+def get_html_with_browser(url, kind="detail"):
+    logger.info(f"🌐 Leasing browser page for URL: {url}")
     start_time = time.time()
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=["--disable-blink-features=AutomationControlled", "--no-sandbox", "--disable-setuid-sandbox"]
-        )
-        context = browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            viewport={"width": 1920, "height": 1080}
-        )
-        page = context.new_page()
-        try:
+    try:
+        with get_pool().lease_page() as page:
             logger.info(f"Navigating to {url}...")
             page.goto(url, timeout=60000, wait_until="domcontentloaded")
             
-            sleep_time = random.uniform(2, 4)
-            logger.info(f"Waiting {sleep_time:.2f}s for dynamic content...")
-            time.sleep(sleep_time)
+            wait_until_ready(page, url, kind)
             
             content = page.content()
             duration = time.time() - start_time
             logger.info(f"✅ Successfully fetched {len(content)} bytes from {url} in {duration:.2f}s")
             return content
-        except Exception as e:
-            logger.error(f"❌ Playwright Error fetching {url}: {e}", exc_info=True)
-            return None
-        finally:
-            browser.close()
-            logger.info("Browser closed.")
+    except Exception as e:
+        logger.error(f"❌ Playwright Error fetching {url}: {e}", exc_info=True)
+        return None
 
 def get_clean_content(html):
     import markdownify
@@ -82,19 +85,32 @@ def get_clean_content(html):
         return ""
 
 
-@celery_app.task(name="scraper.fetch_links")
-def fetch_links_task(start_url):
-    logger.info(f"🔗 [TASK] Fetching links started for: {start_url}")
-    
+@celery_app.task(name="scraper.fetch_links", bind=True, max_retries=None)
+def fetch_links_task(self, start_url, run_id=None):
     r = redis.from_url(REDIS_URL)
-    r.setex("system:crawling", 600, "true")
-    r.publish("job_updates", json.dumps({"type": "crawl_started", "url": start_url}))
+    try:
+        # Globales Limit für Listing-Seiten und Limit pro Domain; ohne freien Slot später erneut
+        with crawl_limits.slots(r, crawl_limits.source_limits(start_url)):
+            return collect_links(r, start_url, run_id)
+    except crawl_limits.SlotUnavailable as e:
+        logger.info(f"⏳ No crawl slot free for {start_url} ({e}), retrying.")
+        raise self.retry(countdown=crawl_limits.retry_countdown(self.request.retries))
+
+def collect_links(r, start_url, run_id):
+    # Frühe Abbrüche geben None zurück; schedule_crawls schließt die Quelle dann im Lauf ab
+    logger.info(f"🔗 [TASK] Fetching links started for: {start_url} (run {run_id})")
+    events.publish(r, {"type": "crawl_started", "url": start_url, "run_id": run_id})
     
-    html = get_html_with_browser(start_url)
+    # ETag/Last-Modified erst mit dem Link-Set übernehmen, sonst liefert der nächste Crawl 304
+    # für ein Listing, dessen Links nie eingeplant wurden
+    validators = {}
+    html = fetch_html(start_url, lambda url: get_html_with_browser(url, kind="listing"), kind="listing", validators=validators)
+    if html is NOT_MODIFIED:
+        logger.info(f"Listing {start_url} not modified since last crawl. Nothing to do.")
+        return None
     if not html:
         logger.warning(f"Failed to fetch content from {start_url}. Aborting crawl.")
-        r.delete("system:crawling")
-        r.publish("job_updates", json.dumps({"type": "crawl_completed"}))
+        crawl_runs.update(r, run_id, sources_failed=1)
         return None
 
     soup = BeautifulSoup(html, 'html.parser')
@@ -108,58 +124,202 @@ def fetch_links_task(start_url):
         all_links.add(full_url)
         
     logger.info(f"Found {len(all_links)} internal links on {start_url}")
+    crawl_runs.update(r, run_id, links=len(all_links))
+
+    new_links_hash = page_cache.links_hash(all_links)
+    if page_cache.get(start_url).get("links_hash") == new_links_hash:
+        logger.info(f"Link set on {start_url} unchanged since last crawl. Skipping.")
+        page_cache.update(start_url, **validators)
+        return None
+    listing = {**validators, "links_hash": new_links_hash}
+    if run_id:
+        # Erst nach erfolgreichem Einplanen übernehmen (schedule_crawls), sonst unterdrückt ein
+        # fehlgeschlagener Filter auch den nächsten Crawl
+        crawl_runs.stash(r, run_id, f"listing:{start_url}", json.dumps(listing))
+    else:
+        page_cache.update(start_url, **listing)
+
     return [start_url, list(all_links)]
 
 @celery_app.task(name="scraper.schedule_crawls")
-def schedule_crawls_task(filtered_links):
+def schedule_crawls_task(filtered_links, run_id=None, source=None):
     r = redis.from_url(os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0"))
     
     if not filtered_links:
         logger.info("Keine relevanten Links gefunden (filtered_links is empty).")
-        r.delete("system:crawling")
-        r.publish("job_updates", json.dumps({"type": "crawl_completed"}))
+        commit_listing(r, run_id, source)
+        crawl_runs.source_done(r, run_id, source)
         return
 
-    logger.info(f"🗓️ Scheduling {len(filtered_links)} detailed crawls...")
+    filtered_links, known = filter_unseen(r, filtered_links, celery_app)
+    if known:
+        logger.info(f"⏭️ Dropped {known} already known job URLs before crawling.")
+    if not filtered_links:
+        logger.info("Alle gefundenen Jobs sind bereits bekannt.")
+        crawl_runs.update(r, run_id, skipped=known)
+        commit_listing(r, run_id, source)
+        crawl_runs.source_done(r, run_id, source)
+        return
+
+    logger.info(f"🗓️ Scheduling {len(filtered_links)} detailed crawls (mode: {CRAWL_MODE}, run {run_id})...")
+    if known:
+        crawl_runs.update(r, run_id, skipped=known)
+    # Latch vor dem Versand scharf schalten: der Lauf endet erst, wenn jede URL analysiert, übersprungen oder fehlgeschlagen ist
+    filtered_links = crawl_runs.schedule(r, run_id, filtered_links)
+    if not filtered_links:
+        logger.info("Alle Links sind in diesem Lauf bereits über eine andere Quelle eingeplant.")
+        commit_listing(r, run_id, source)
+        crawl_runs.source_done(r, run_id, source)
+        return
     
-    for link in filtered_links:
-        celery_app.send_task('scraper.scrape_detail', args=[link], queue='scraper_queue')
+    sent = 0
+    try:
+        if CRAWL_MODE == "batch":
+            for i in range(0, len(filtered_links), SCRAPE_BATCH_SIZE):
+                batch = filtered_links[i:i + SCRAPE_BATCH_SIZE]
+                celery_app.send_task('scraper.scrape_batch', args=[batch], kwargs={"run_id": run_id}, queue='scraper_queue')
+                sent += len(batch)
+        else:
+            for link in filtered_links:
+                celery_app.send_task('scraper.scrape_detail', args=[link], kwargs={"run_id": run_id}, queue='scraper_queue')
+                sent += 1
+    except Exception:
+        # Nicht versendete URLs aus dem Latch nehmen; die Quelle gibt anschließend der errback frei
+        crawl_runs.record(r, run_id, "failed", filtered_links[sent:])
+        raise
     
     logger.info(f"All {len(filtered_links)} tasks scheduled.")
-    r.delete("system:crawling")
-    r.publish("job_updates", json.dumps({"type": "crawl_completed"}))
+    commit_listing(r, run_id, source)
+    crawl_runs.source_done(r, run_id, source)
 
-@celery_app.task(name="scraper.scrape_detail")
-def scrape_job_detail_task(url):
-    logger.info(f"🕵️ [TASK] Scraping Detail for: {url}")
+@celery_app.task(name="scraper.source_failed")
+def source_failed_task(*args, run_id=None, source=None):
+    # errback jedes Kettenglieds (fetch_links, filter_urls, schedule_crawls): ohne ihn bliebe das Token
+    # der Quelle im Latch und der Lauf bis CRAWL_RUN_TIMEOUT aktiv. *args: Celery übergibt je nach
+    # Worker (request, exc, traceback) oder nur die Task-ID
+    logger.error(f"❌ Crawl chain for {source} failed (run {run_id}), releasing source.")
+    r = redis.from_url(REDIS_URL)
+    crawl_runs.source_done(r, run_id, source, failed=True)
+
+def commit_listing(r, run_id, source):
+    # Link-Set und Validatoren des Listings gelten erst jetzt als verarbeitet
+    if not run_id or not source:
+        return
+    listing = crawl_runs.pop_stash(r, run_id, f"listing:{source}")
+    if listing:
+        page_cache.update(source, **json.loads(listing))
+
+def process_job_page(url, html, run_id=None):
+    """Extract the job from a fetched page and hand it to the AI service.
+
+    Returns the outcome for the crawl run: "fetched" (sent to analysis),
+    "skipped" or "failed".
+    """
+    if html is NOT_MODIFIED:
+        logger.info(f"⏭️ {url} not modified, skipping analysis.")
+        return "skipped"
+    if not html: 
+        logger.warning(f"Skipping {url} due to download failure.")
+        return "failed"
+
+    cached = page_cache.get(url)
+    new_raw_hash = page_cache.raw_hash(html)
+    if cached.get("raw_hash") == new_raw_hash:
+        logger.info(f"⏭️ {url} unchanged (identical HTML), skipping analysis.")
+        return "skipped"
+
+    content = get_clean_content(html)
+    if not content:
+        logger.warning(f"No clean content extracted from {url}")
+        # Depending on logic, might still want to process or skip. Proceeding for now but logging warning.
+
+    new_content_hash = page_cache.content_hash(content)
+    page_cache.update(url, raw_hash=new_raw_hash, content_hash=new_content_hash)
+    if cached.get("content_hash") == new_content_hash:
+        logger.info(f"⏭️ {url} unchanged (same cleaned content), skipping analysis.")
+        return "skipped"
+
+    soup = BeautifulSoup(html, 'html.parser')
+    title = soup.find('h1').get_text().strip() if soup.find('h1') else "Job Position"
     
-    try:
-        html = get_html_with_browser(url)
-        if not html: 
-            logger.warning(f"Skipping {url} due to download failure.")
-            return
+    job_id = str(uuid.uuid5(uuid.NAMESPACE_URL, url))
+    logger.info(f"Extracted Job: '{title}' (ID: {job_id}) from {url}")
 
-        content = get_clean_content(html)
-        if not content:
-            logger.warning(f"No clean content extracted from {url}")
-            # Depending on logic, might still want to process or skip. Proceeding for now but logging warning.
+    job_data = {
+        "id": job_id,
+        "title": title,
+        "company": urlparse(url).netloc,
+        "description": content[:4000],
+        "url": url,
+        "content_hash": new_content_hash,
+        "run_id": run_id
+    }
+    
+    celery_app.send_task("ai.analyze_job", args=[job_data], queue="ai_queue")
+    logger.info(f"Triggered ai.analyze_job for {job_id}")
+    return "fetched"
 
-        soup = BeautifulSoup(html, 'html.parser')
-        title = soup.find('h1').get_text().strip() if soup.find('h1') else "Job Position"
-        
-        job_id = str(uuid.uuid5(uuid.NAMESPACE_URL, url))
-        logger.info(f"Extracted Job: '{title}' (ID: {job_id}) from {url}")
-
-        job_data = {
-            "id": job_id,
-            "title": title,
-            "company": urlparse(url).netloc,
-            "description": content[:4000],
-            "url": url
-        }
-        
-        celery_app.send_task("ai.analyze_job", args=[job_data], queue="ai_queue")
-        logger.info(f"Triggered ai.analyze_job for {job_id}")
-        
+def record_page(r, run_id, url, outcome):
+    # "fetched" bleibt im Latch offen, bis der AI-Service den Job gespeichert hat
+    if outcome == "fetched":
+        crawl_runs.update(r, run_id, fetched=1)
+    else:
+        if outcome == "skipped":
+            # Unverändert: erst nach SEEN_RECHECK_TTL wieder prüfen
+            mark_checked(r, url)
+        crawl_runs.record(r, run_id, outcome, [url])
+
+@celery_app.task(name="scraper.scrape_detail", bind=True, max_retries=None)
+def scrape_job_detail_task(self, url, run_id=None):
+    r = redis.from_url(REDIS_URL)
+    try:
+        with crawl_limits.slots(r, crawl_limits.domain_limits(url)):
+            scrape_detail(r, url, run_id)
+    except crawl_limits.SlotUnavailable:
+        raise self.retry(countdown=crawl_limits.retry_countdown(self.request.retries))
+
+def scrape_detail(r, url, run_id):
+    logger.info(f"🕵️ [TASK] Scraping Detail for: {url}")
+    try:
+        outcome = process_job_page(url, fetch_html(url, get_html_with_browser), run_id)
     except Exception as e:
         logger.error(f"Error in scrape_job_detail_task for {url}: {e}", exc_info=True)
+        outcome = "failed"
+    record_page(r, run_id, url, outcome)
+
+@celery_app.task(name="scraper.scrape_batch", bind=True, max_retries=None)
+def scrape_batch_task(self, urls, run_id=None):
+    if not urls:
+        return
+    r = redis.from_url(REDIS_URL)
+    try:
+        # Alle URLs eines Batches stammen von derselben Domain wie ihr Listing; so viele Seiten
+        # gleichzeitig, wie Domain-Slots frei sind
+        with crawl_limits.domain_slots(r, urls[0], SCRAPER_MAX_IN_FLIGHT) as in_flight:
+            scrape_batch(r, urls, run_id, in_flight)
+    except crawl_limits.SlotUnavailable:
+        raise self.retry(countdown=crawl_limits.retry_countdown(self.request.retries))
+
+def scrape_batch(r, urls, run_id, in_flight=SCRAPER_MAX_IN_FLIGHT):
+    logger.info(f"🕵️ [TASK] Scraping batch of {len(urls)} URLs ({in_flight} in flight)")
+    start_time = time.time()
+    done = set()
+
+    def on_page(url, html):
+        try:
+            outcome = process_job_page(url, html, run_id)
+        except Exception as e:
+            logger.error(f"Error processing {url} in scrape_batch_task: {e}", exc_info=True)
+            outcome = "failed"
+        done.add(url)
+        record_page(r, run_id, url, outcome)
+
+    try:
+        crawl_batch(urls, on_page, max_in_flight=in_flight)
+    except Exception as e:
+        logger.error(f"Error in scrape_batch_task: {e}", exc_info=True)
+    # Nicht verarbeitete URLs (Abbruch) als fehlgeschlagen zählen, sonst bleibt der Lauf offen
+    missing = [url for url in urls if url not in done]
+    if missing:
+        crawl_runs.record(r, run_id, "failed", missing)
+    logger.info(f"Batch of {len(urls)} URLs finished in {time.time() - start_time:.2f}s")